@@ -1,13 +1,164 @@
 import librosa
 import numpy as np
-from scipy.signal import butter, lfilter
-import noisereduce as nr
+from scipy.signal import butter, lfilter, welch
+from numpy.lib.stride_tricks import sliding_window_view
+
+from spectral_gate import NoiseProfile, spectral_gate
+
+class AudioFeatures:
+    def __init__(self, audio, frame_length=8192, hop_length=2048):
+        """
+        Покадровые признаки сигнала (RMS, ZCR, пик), вычисляемые за один проход.
+        Кадры совпадают с librosa.feature.rms(center=True): кадр i центрирован на отсчёте i * hop_length.
+        """
+        if frame_length % hop_length:
+            raise ValueError("frame_length должен быть кратен hop_length")
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.n_samples = len(audio)
+
+        # Сигнал дополняется нулями и режется на блоки по hop_length,
+        # признаки кадра собираются из frame_length // hop_length соседних блоков
+        blocks_per_frame = frame_length // hop_length
+        n_frames = 1 + self.n_samples // hop_length
+        n_blocks = n_frames + blocks_per_frame - 1
+        pad = frame_length // 2
+        padded = np.zeros(n_blocks * hop_length, dtype=audio.dtype)
+        padded[pad:pad + self.n_samples] = audio
+        blocks = padded.reshape(n_blocks, hop_length)
+
+        block_energy = np.einsum("ij,ij->i", blocks, blocks, dtype=np.float64)
+        block_peak = np.maximum(blocks.max(axis=1), -blocks.min(axis=1))
+        crossings = np.empty(padded.size, dtype=bool)
+        crossings[0] = False
+        np.not_equal(np.signbit(padded[1:]), np.signbit(padded[:-1]), out=crossings[1:])
+        block_crossings = crossings.reshape(n_blocks, hop_length).sum(axis=1)
+
+        frame_energy = sliding_window_view(block_energy, blocks_per_frame).sum(axis=1)
+        # Переход на первом отсчёте кадра относится к предыдущему кадру
+        frame_crossings = sliding_window_view(block_crossings, blocks_per_frame).sum(axis=1) \
+            - crossings[::hop_length][:n_frames]
+
+        self.rms = np.sqrt(frame_energy / frame_length)
+        self.zcr = frame_crossings / frame_length
+        self.peak = sliding_window_view(block_peak, blocks_per_frame).max(axis=1)
+        self.global_rms = float(np.sqrt(block_energy.sum() / self.n_samples)) if self.n_samples else 0.0
+
+    def matches(self, frame_length, hop_length):
+        """Проверяет, посчитаны ли признаки с нужной сеткой кадров."""
+        return self.frame_length == frame_length and self.hop_length == hop_length
+
+    def segment_frames(self, start, end):
+        """Срез кадров, центры которых попадают в участок сигнала [start, end]."""
+        return slice(start // self.hop_length, end // self.hop_length + 1)
+
+
+# Стадии предобработки в порядке выполнения
+PREPROCESSING_STAGES = ("spikes", "volume", "bandpass", "denoise")
+
+# Запись считается чистой, если речь громче фона хотя бы на столько дБ: шумоподавление не нужно
+CLEAN_SNR_DB = 30.0
+# Доля мощности вне полосы полосового фильтра, при которой фильтр нужен (гул, шипение)
+OUT_OF_BAND_RATIO = 0.02
+# Отсчёты не тише CLIPPING_LEVEL считаются клиппингом. Если их доля больше CLIPPING_RATIO,
+# плато клиппинга - не щелчки, и удаление пиков испортило бы громкие места
+CLIPPING_LEVEL = 0.99
+CLIPPING_RATIO = 0.001
+# Спектр оценивается по нескольким отрывкам записи, а не по всей записи
+SPECTRUM_EXCERPTS = 30
+SPECTRUM_EXCERPT_SECONDS = 1.0
+
+
+def parse_stage_overrides(value):
+    """
+    Разбирает настройку предобработки из запроса: None или "auto" - выбор по анализу записи,
+    "all" / "none" - все стадии включены / выключены, словарь {стадия: bool} - только эти стадии
+    заданы явно. Возвращает ({стадия: bool}, error).
+    """
+    if value is None or value == "auto":
+        return {}, None
+    if value in ("all", "none"):
+        return {stage: value == "all" for stage in PREPROCESSING_STAGES}, None
+    if not isinstance(value, dict):
+        return None, 'Настройка предобработки: "auto", "all", "none" или словарь {стадия: true/false}'
+    unknown = [stage for stage in value if stage not in PREPROCESSING_STAGES]
+    if unknown:
+        return None, f"Неизвестные стадии предобработки: {', '.join(map(str, unknown))}. " \
+                     f"Доступны: {', '.join(PREPROCESSING_STAGES)}"
+    return {stage: bool(enabled) for stage, enabled in value.items()}, None
+
+
+class AudioAnalysis:
+    def __init__(self, audio, sr, features=None, target_rms=0.05, threshold_multiplier=3, lowcut=80, highcut=7500):
+        """
+        Быстрый анализ записи перед предобработкой: отношение речи к фону, клиппинг, щелчки,
+        громкость и доля мощности вне полосы lowcut-highcut. По нему выбираются нужные стадии.
+        """
+        if features is None:
+            features = AudioFeatures(audio)
+        self.target_rms = target_rms
+        self.rms = features.global_rms
+
+        # Уровень речи и фона - громкие и тихие кадры покадрового RMS
+        noise_floor, speech = np.percentile(features.rms, [10, 95]) if features.rms.size else (0.0, 0.0)
+        self.snr_db = float(20 * np.log10(speech / noise_floor)) if noise_floor > 0 and speech > 0 else None
+
+        self.clipping_ratio = float(np.count_nonzero(np.abs(audio) >= CLIPPING_LEVEL)) / max(audio.size, 1)
+        self.spikes = AdvancedAudioProcessor.find_spikes(audio, threshold_multiplier) if audio.size else []
+        self.out_of_band_ratio = self.band_power_ratio(audio, sr, lowcut, highcut)
+
+    @staticmethod
+    def band_power_ratio(audio, sr, lowcut, highcut):
+        """Доля мощности вне полосы lowcut-highcut по SPECTRUM_EXCERPTS отрывкам, равномерно взятым из записи."""
+        excerpt = int(SPECTRUM_EXCERPT_SECONDS * sr)
+        if audio.size < excerpt:
+            excerpts = audio[np.newaxis]
+        else:
+            starts = np.linspace(0, audio.size - excerpt, SPECTRUM_EXCERPTS).astype(int)
+            excerpts = np.stack([audio[start:start + excerpt] for start in np.unique(starts)])
+        if excerpts.shape[1] < 256:
+            return 0.0
+        frequencies, power = welch(excerpts, fs=sr, nperseg=min(1024, excerpts.shape[1]), axis=-1)
+        power = power.sum(axis=0)
+        total = power.sum()
+        if total <= 0:
+            return 0.0
+        return float(power[(frequencies < lowcut) | (frequencies > highcut)].sum() / total)
+
+    def choose_stages(self, overrides=None):
+        """
+        Стадии, которые стоит выполнить ({стадия: bool}); overrides из parse_stage_overrides
+        перекрывают выбор. Шумоподавление пропускается для чистых записей, удаление пиков -
+        если пиков нет или запись клиппирована, громкость - если запись и так не тише target_rms.
+        """
+        stages = {
+            "spikes": bool(self.spikes) and self.clipping_ratio <= CLIPPING_RATIO,
+            "volume": 0 < self.rms < self.target_rms,
+            "bandpass": self.out_of_band_ratio > OUT_OF_BAND_RATIO,
+            "denoise": self.snr_db is not None and self.snr_db < CLEAN_SNR_DB,
+        }
+        stages.update(overrides or {})
+        return stages
+
+    def summary(self):
+        """Показатели анализа для результата задачи."""
+        return {
+            "snr_db": round(self.snr_db, 1) if self.snr_db is not None else None,
+            "clipping_ratio": round(self.clipping_ratio, 5),
+            "spikes": len(self.spikes),
+            "rms": round(self.rms, 5),
+            "out_of_band_ratio": round(self.out_of_band_ratio, 4),
+        }
+
 
 class AdvancedAudioProcessor:
     '''Набор статичных методов для предобработки аудио'''
     @staticmethod
-    def preprocess_audio_volume(audio, target_rms=0.05, threshold_multiplier=3):
-        rms = np.sqrt(np.mean(audio**2))
+    def preprocess_audio_volume(audio, target_rms=0.05, threshold_multiplier=3, features=None):
+        if features is not None:
+            rms = features.global_rms
+        else:
+            rms = np.sqrt(np.dot(audio, audio) / audio.size) if audio.size else 0.0
         spikes = AdvancedAudioProcessor.find_spikes(audio, threshold_multiplier=threshold_multiplier)
         if spikes:
             audio = AdvancedAudioProcessor.remove_spikes(audio, spikes)
@@ -15,31 +166,46 @@ class AdvancedAudioProcessor:
             audio = AdvancedAudioProcessor.increase_volume(audio, current_rms=rms, target_rms=target_rms)
         return audio
 
+    @staticmethod
+    def _runs(indices, max_step=1):
+        """
+        Границы серий в отсортированном массиве индексов: соседние элементы
+        принадлежат одной серии, если разница между ними не больше max_step.
+        Возвращает позиции первого и последнего элемента каждой серии.
+        """
+        breaks = np.flatnonzero(np.diff(indices) > max_step)
+        first = np.concatenate(([0], breaks + 1))
+        last = np.concatenate((breaks, [len(indices) - 1]))
+        return first, last
+
     @staticmethod
     def find_spikes(audio, threshold_multiplier=3):
         abs_audio = np.abs(audio)
-        perc_90 = np.percentile(abs_audio, 90)
-        perc_99 = np.percentile(abs_audio, 99)
+        perc_90, perc_99 = np.percentile(abs_audio, [90, 99])
         threshold = perc_90 + threshold_multiplier * perc_99
-        spike_indices = np.where(abs_audio > threshold)[0]
-        spikes = []
-        if len(spike_indices) > 0:
-            start = spike_indices[0]
-            for i in range(1, len(spike_indices)):
-                if spike_indices[i] > spike_indices[i - 1] + 1:
-                    spikes.append((start, spike_indices[i - 1]))
-                    start = spike_indices[i]
-            spikes.append((start, spike_indices[-1]))
-        return spikes
+        spike_indices = np.flatnonzero(abs_audio > threshold)
+        if spike_indices.size == 0:
+            return []
+        first, last = AdvancedAudioProcessor._runs(spike_indices)
+        return list(zip(spike_indices[first].tolist(), spike_indices[last].tolist()))
 
     @staticmethod
     def remove_spikes(audio, spikes):
         audio_copy = audio.copy()
-        for start, end in spikes:
-            pre_value = audio[start - 1] if start > 0 else 0
-            post_value = audio[end + 1] if end < len(audio) - 1 else 0
-            mean_value = (pre_value + post_value) / 2
-            audio_copy[start:end + 1] = mean_value
+        if not spikes:
+            return audio_copy
+        bounds = np.asarray(spikes)
+        starts, ends = bounds[:, 0], bounds[:, 1]
+
+        # Значения соседей берутся из исходного сигнала, за краями массива - 0
+        pre_values = np.where(starts > 0, audio[np.maximum(starts - 1, 0)], 0)
+        post_values = np.where(ends < len(audio) - 1, audio[np.minimum(ends + 1, len(audio) - 1)], 0)
+        mean_values = (pre_values + post_values) / 2
+
+        # Разворачиваем серии в плоский список индексов и заполняем их одним присваиванием
+        lengths = ends - starts + 1
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        audio_copy[np.arange(lengths.sum()) + offsets] = np.repeat(mean_values, lengths)
         return audio_copy
 
     @staticmethod
@@ -49,66 +215,226 @@ class AdvancedAudioProcessor:
         return amplified_audio
 
     @staticmethod
-    def bandpass_filter(audio, sr=16000, lowcut=80, highcut=7500, order=4):
+    def bandpass_coefficients(sr=16000, lowcut=80, highcut=7500, order=4):
         nyquist = 0.5 * sr
         low = lowcut / nyquist
         high = highcut / nyquist
-        b, a = butter(order, [low, high], btype="band")
+        return butter(order, [low, high], btype="band")
+
+    @staticmethod
+    def bandpass_filter(audio, sr=16000, lowcut=80, highcut=7500, order=4):
+        b, a = AdvancedAudioProcessor.bandpass_coefficients(sr, lowcut, highcut, order)
         return lfilter(b, a, audio)
 
     @staticmethod
-    def find_quiet_segments(audio, sr, frame_size=8192, hop_length=2048, min_duration=1.0, max_gap=3):
-        rms = librosa.feature.rms(y=audio, frame_length=frame_size, hop_length=hop_length).flatten()
+    def find_quiet_segments(audio, sr, frame_size=8192, hop_length=2048, min_duration=1.0, max_gap=3, features=None):
+        if features is not None and features.matches(frame_size, hop_length):
+            rms = features.rms
+        else:
+            rms = librosa.feature.rms(y=audio, frame_length=frame_size, hop_length=hop_length).flatten()
         rms_high = np.percentile(rms, 20)
-        quiet_indices = np.where(rms <= rms_high)[0]
-        quiet_segments = []
-        start = None
-        count = 0
-        gap = 0
+        quiet_indices = np.flatnonzero(rms <= rms_high)
+        if quiet_indices.size == 0:
+            return []
         min_quiet_frames = int((sr / hop_length) * min_duration)
-        for i in range(len(quiet_indices)):
-            if start is None:
-                start = quiet_indices[i] * hop_length
-                count = 1
-                gap = 0
-            elif quiet_indices[i] == quiet_indices[i - 1] + 1:
-                count += 1
-                gap = 0
-            else:
-                if (quiet_indices[i] - quiet_indices[i - 1]) <= max_gap:
-                    count += 1
-                    gap += 1
-                else:
-                    if count >= min_quiet_frames:
-                        end = quiet_indices[i - 1] * hop_length
-                        quiet_segments.append((start, end))
-                    start = quiet_indices[i] * hop_length
-                    count = 1
-                    gap = 0
-        if start is not None and count >= min_quiet_frames:
-            end = quiet_indices[-1] * hop_length
-            quiet_segments.append((start, end))
-        return quiet_segments
+
+        # Тихие кадры объединяются в участок, если разрыв между ними не больше max_gap
+        first, last = AdvancedAudioProcessor._runs(quiet_indices, max(max_gap, 1))
+        keep = (last - first + 1) >= min_quiet_frames
+        starts = quiet_indices[first[keep]] * hop_length
+        ends = quiet_indices[last[keep]] * hop_length
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    @staticmethod
+    def find_speech_segments(audio, sr, features=None, threshold_ratio=0.1, min_silence=0.5, min_speech=0.25,
+                             pad=0.2):
+        """
+        Участки речи по покадровому RMS: кадр считается речью, если его энергия выше
+        порога между уровнем шума (10-й перцентиль) и громкой речью (95-й перцентиль).
+        Паузы короче min_silence склеиваются, участки расширяются на pad секунд.
+        """
+        if features is None:
+            features = AudioFeatures(audio)
+        if audio.size == 0:
+            return []
+        hop = features.hop_length
+        rms = features.rms
+
+        noise_floor, loud = np.percentile(rms, [10, 95])
+        threshold = noise_floor + threshold_ratio * (loud - noise_floor)
+        speech_frames = np.flatnonzero(rms > threshold)
+        if speech_frames.size == 0:
+            return []
+
+        first, last = AdvancedAudioProcessor._runs(speech_frames, max(int(min_silence * sr / hop), 1))
+        pad_samples = int(pad * sr) + hop // 2
+        starts = np.maximum(speech_frames[first] * hop - pad_samples, 0)
+        ends = np.minimum(speech_frames[last] * hop + pad_samples, audio.size)
+        keep = (ends - starts) >= int(min_speech * sr)
+        return list(zip(starts[keep].tolist(), ends[keep].tolist()))
 
     @staticmethod
-    def find_noisiest_segment(audio, sr, quiet_segments, max_noise_duration=1.5):
+    def find_noisiest_segment(audio, sr, quiet_segments, max_noise_duration=1.5, features=None):
         best_segment = None
         max_zcr = 0
         max_noise_samples = int(sr * max_noise_duration)
         for start, end in quiet_segments:
             segment = audio[start:end]
-            zcr = np.mean(librosa.feature.zero_crossing_rate(y=segment))
+            if features is not None:
+                zcr = np.mean(features.zcr[features.segment_frames(start, end)])
+            else:
+                zcr = np.mean(librosa.feature.zero_crossing_rate(y=segment))
             if zcr > max_zcr:
                 max_zcr = zcr
                 best_segment = segment[:max_noise_samples]
         return best_segment
 
     @staticmethod
-    def remove_noise(audio, sr, frame_size=8192, hop_length=2048, min_duration=1.0, max_noise_duration=1.5, max_gap=3):
-        quiet_segments = AdvancedAudioProcessor.find_quiet_segments(audio, sr, frame_size, hop_length, min_duration, max_gap)
+    def find_noise_segment(audio, sr, frame_size=8192, hop_length=2048, min_duration=1.0, max_noise_duration=1.5,
+                           max_gap=3, features=None):
+        """Возвращает образец шума из самого шумного тихого участка или None."""
+        if features is None or not features.matches(frame_size, hop_length):
+            features = AudioFeatures(audio, frame_size, hop_length)
+        quiet_segments = AdvancedAudioProcessor.find_quiet_segments(
+            audio, sr, frame_size, hop_length, min_duration, max_gap, features=features
+        )
         if not quiet_segments:
-            return audio
-        noise_segment = AdvancedAudioProcessor.find_noisiest_segment(audio, sr, quiet_segments, max_noise_duration)
+            return None
+        return AdvancedAudioProcessor.find_noisiest_segment(
+            audio, sr, quiet_segments, max_noise_duration, features=features
+        )
+
+    @staticmethod
+    def estimate_noise_profile(audio, sr, frame_size=8192, hop_length=2048, min_duration=1.0, max_noise_duration=1.5,
+                               max_gap=3, features=None):
+        """Профиль шума по самому шумному тихому участку или None, если тихих участков нет."""
+        noise_segment = AdvancedAudioProcessor.find_noise_segment(
+            audio, sr, frame_size, hop_length, min_duration, max_noise_duration, max_gap, features=features
+        )
         if noise_segment is None:
+            return None
+        return NoiseProfile.from_noise(noise_segment, sr)
+
+    @staticmethod
+    def remove_noise(audio, sr, frame_size=8192, hop_length=2048, min_duration=1.0, max_noise_duration=1.5, max_gap=3,
+                     features=None, noise_profile=None, workers=1):
+        """
+        Спектральное подавление шума. Без noise_profile профиль оценивается по самой записи;
+        workers - число потоков для поблочной обработки длинных записей.
+        """
+        if noise_profile is None or not noise_profile.matches(sr):
+            noise_profile = AdvancedAudioProcessor.estimate_noise_profile(
+                audio, sr, frame_size, hop_length, min_duration, max_noise_duration, max_gap, features=features
+            )
+        if noise_profile is None:
             return audio
-        return nr.reduce_noise(y=audio, sr=sr, y_noise=noise_segment, prop_decrease=0.8)
+        return spectral_gate(audio, sr, noise_profile, prop_decrease=0.8, workers=workers)
+
+
+class StreamingAudioPreprocessor:
+    # Блоки короче этого значения не проходят подавление шума (слишком мало для STFT)
+    min_noise_reduce_samples = 4096
+    # Наибольшее усиление (+20 дБ): тихое или пустое начало записи не разгоняется до шума на всю шкалу
+    max_gain = 10.0
+    # За столько секунд в начале блока усиление плавно переходит от значения прошлого блока
+    gain_ramp_seconds = 0.5
+
+    def __init__(self, sr=16000, target_rms=0.05, threshold_multiplier=3, lowcut=80, highcut=7500, order=4,
+                 frame_size=8192, hop_length=2048, min_duration=1.0, max_noise_duration=1.5, max_gap=3,
+                 noise_profile=None, stage_overrides=None):
+        """
+        Поблочная предобработка длинных записей с сохранением состояния между блоками:
+        накопленный RMS для громкости, состояние фильтра (zi) и профиль шума.
+        Если noise_profile не передан, он оценивается по первому блоку с тихим участком.
+        Стадии выбираются по анализу первого блока (AudioAnalysis) с учётом stage_overrides.
+        """
+        self.sr = sr
+        self.lowcut = lowcut
+        self.highcut = highcut
+        self.target_rms = target_rms
+        self.threshold_multiplier = threshold_multiplier
+        self.frame_size = frame_size
+        self.hop_length = hop_length
+        self.min_duration = min_duration
+        self.max_noise_duration = max_noise_duration
+        self.max_gap = max_gap
+
+        self.b, self.a = AdvancedAudioProcessor.bandpass_coefficients(sr, lowcut, highcut, order)
+        self.zi = np.zeros(max(len(self.a), len(self.b)) - 1)
+
+        self.sum_squares = 0.0
+        self.n_samples = 0
+        self.gain = None
+        self.noise_profile = noise_profile if noise_profile is not None and noise_profile.matches(sr) else None
+
+        # Выбранные стадии и показатели анализа, известны после первого блока
+        self.stage_overrides = stage_overrides or {}
+        self.stages = None
+        self.analysis = None
+
+    def process_block(self, block):
+        """Обрабатывает очередной блок и возвращает результат той же длины."""
+        if self.stages is None:
+            analysis = AudioAnalysis(
+                block, self.sr, target_rms=self.target_rms, threshold_multiplier=self.threshold_multiplier,
+                lowcut=self.lowcut, highcut=self.highcut,
+            )
+            self.stages = analysis.choose_stages(self.stage_overrides)
+            # Громкость по одному блоку не решается: усиление следует накопленному RMS (см. volume_gain)
+            self.stages["volume"] = self.stage_overrides.get("volume", True)
+            self.analysis = analysis.summary()
+
+        # Громкость считаем по всему уже прочитанному сигналу, чтобы усиление не скакало между блоками
+        self.sum_squares += float(np.dot(block, block))
+        self.n_samples += block.size
+        rms = np.sqrt(self.sum_squares / self.n_samples)
+
+        if self.stages["spikes"]:
+            spikes = AdvancedAudioProcessor.find_spikes(block, threshold_multiplier=self.threshold_multiplier)
+            if spikes:
+                block = AdvancedAudioProcessor.remove_spikes(block, spikes)
+        if self.stages["volume"]:
+            block = self.apply_gain(block, self.volume_gain(rms))
+
+        # Полосовой фильтр продолжает работу с состояния предыдущего блока
+        if self.stages["bandpass"]:
+            block, self.zi = lfilter(self.b, self.a, block, zi=self.zi)
+
+        if self.stages["denoise"]:
+            # Профиль шума берём из первого блока, где нашёлся тихий участок
+            if self.noise_profile is None:
+                self.noise_profile = self.estimate_noise_profile(block)
+
+            if self.noise_profile is not None and block.size >= self.min_noise_reduce_samples:
+                block = spectral_gate(block, self.sr, self.noise_profile, prop_decrease=0.8)
+
+        return block
+
+    def volume_gain(self, rms):
+        """Усиление до target_rms по накопленному RMS, не больше max_gain; громкие записи не меняются."""
+        if rms <= 0:
+            # Пока звучала только тишина, усиление не меняется
+            return self.gain if self.gain is not None else 1.0
+        return min(max(self.target_rms / rms, 1.0), self.max_gain)
+
+    def apply_gain(self, block, gain):
+        """
+        Применяет усиление к блоку. На первых gain_ramp_seconds оно линейно меняется от усиления
+        прошлого блока, чтобы на границе блоков не было скачка громкости.
+        """
+        previous = self.gain if self.gain is not None else gain
+        self.gain = gain
+        if previous == gain == 1.0:
+            return block
+        gains = np.full(block.size, gain, dtype=np.float32)
+        ramp = min(int(self.gain_ramp_seconds * self.sr), block.size)
+        gains[:ramp] = np.linspace(previous, gain, ramp, endpoint=False)
+        return np.clip(block * gains, -1.0, 1.0)
+
+    def estimate_noise_profile(self, block):
+        """Профиль шума по самому шумному тихому участку блока. Возвращает None, если его нет."""
+        if block.size < self.frame_size:
+            return None
+        return AdvancedAudioProcessor.estimate_noise_profile(
+            block, self.sr, self.frame_size, self.hop_length, self.min_duration, self.max_noise_duration, self.max_gap
+        )
@@ -1,48 +1,241 @@
-import io
+import json
+import subprocess
+import threading
+import tracemalloc
 import ffmpeg
-import librosa
+import numpy as np
 
-from audio_preprocessing import AdvancedAudioProcessor
+from audio_preprocessing import AdvancedAudioProcessor, AudioAnalysis, AudioFeatures, StreamingAudioPreprocessor
+from spectral_gate import NoiseProfile
+from speech_windows import pack_speech_windows, whole_audio_window
+from sharded_transcriber import shard_windows
+from metrics import timed
+
+SAMPLE_RATE = 16000
+
+# Поблочная обработка: размер блока и окно в его конце, где ищется тихая точка разреза
+DEFAULT_BLOCK_SECONDS = 30
+BOUNDARY_SECONDS = 2.0
+BOUNDARY_FRAME = 400
 
 class AudioProcessor:
-    def __init__(self, audio_bytes):
+    def __init__(self, upload, noise_profile_path=None, denoise_workers=1, stage_overrides=None):
         """
-        Класс для обработки аудио
+        Класс для обработки аудио. upload - UploadBuffer с загруженным файлом.
+        noise_profile_path - файл профиля шума источника записи: если он есть, шум подавляется
+        по нему, иначе туда сохраняется профиль, оценённый по этой записи.
+        denoise_workers - число потоков подавления шума для длинных записей.
+        stage_overrides - стадии предобработки, заданные в запросе явно (см. parse_stage_overrides).
         """
-        self.audio_bytes = audio_bytes
+        self.upload = upload
+        self.noise_profile_path = noise_profile_path
+        self.denoise_workers = denoise_workers
+        self.stage_overrides = stage_overrides or {}
         self.output_audio = None
+        # Покадровые признаки предобработанного сигнала, доступны после preprocess
+        self.features = None
+        # Выбранные стадии предобработки и показатели анализа записи, доступны после предобработки
+        self.preprocessing = None
+        # Время шагов обработки (секунды)
+        self.timings = {}
 
-    def convert_to_wav(self):
-        """Конвертирует аудио/видеофайл в WAV (16-bit PCM, 16000 Hz)."""
+    def decode_audio(self):
+        """Декодирует аудио/видеофайл в NumPy массив (float32, моно, 16000 Hz)."""
         try:
-            process = (
-                ffmpeg.input('pipe:0')
-                .output('pipe:1', format='wav', ar=16000, ac=1, sample_fmt="s16")
-                .run(input=self.audio_bytes, capture_stdout=True, capture_stderr=True)
+            # Файл на диске отдаём ffmpeg по пути, из памяти - через stdin без копирования
+            stream, input_data = self._input_stream()
+
+            # Сырой PCM без WAV-контейнера: stdout сразу интерпретируется как массив
+            out, _ = (
+                stream
+                .output('pipe:1', format='f32le', acodec='pcm_f32le', ar=SAMPLE_RATE, ac=1)
+                .run(input=input_data, capture_stdout=True, capture_stderr=True)
             )
-            self.output_audio = process[0]
+            self.output_audio = np.frombuffer(out, dtype=np.float32)
             return self.output_audio, None
 
         except Exception as e:
-            print(f"Ошибка конвертации аудиофайла: {e}")
+            print(f"Ошибка декодирования аудиофайла: {e}")
+            return None, str(e)
+
+    def probe_duration(self):
+        """
+        Длительность записи (сек) из заголовка контейнера через ffprobe, без декодирования.
+        Возвращает (duration, error).
+        """
+        source = 'pipe:0' if self.upload.in_memory else self.upload.path
+        try:
+            result = subprocess.run(
+                ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', source],
+                input=self.upload.getbuffer() if self.upload.in_memory else None,
+                capture_output=True,
+                check=True,
+                timeout=30,
+            )
+            return float(json.loads(result.stdout)["format"]["duration"]), None
+
+        except Exception as e:
             return None, str(e)
 
+    def _input_stream(self):
+        """Возвращает вход ffmpeg и данные для stdin (None, если файл на диске)."""
+        if self.upload.in_memory:
+            return ffmpeg.input('pipe:0'), self.upload.getbuffer()
+        return ffmpeg.input(self.upload.path), None
+
+    def iter_decoded_blocks(self, block_seconds=DEFAULT_BLOCK_SECONDS):
+        """
+        Декодирует файл потоково и отдаёт блоки float32 не длиннее block_seconds.
+        Блок режется в самой тихой точке последних BOUNDARY_SECONDS, остаток переходит в следующий.
+        """
+        stream, input_data = self._input_stream()
+        process = (
+            stream
+            .output('pipe:1', format='f32le', acodec='pcm_f32le', ar=SAMPLE_RATE, ac=1)
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdin=input_data is not None, pipe_stdout=True, pipe_stderr=True)
+        )
+
+        # stdin и stderr обслуживаем в отдельных потоках, иначе ffmpeg может заблокироваться на пайпе
+        stderr_chunks = []
+        threads = [threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)]
+        if input_data is not None:
+            threads.append(threading.Thread(target=self._feed_stdin, args=(process, input_data), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        block_samples = int(block_seconds * SAMPLE_RATE)
+        boundary_samples = min(int(BOUNDARY_SECONDS * SAMPLE_RATE), block_samples // 2)
+        carry = np.empty(0, dtype=np.float32)
+        try:
+            while True:
+                need_bytes = (block_samples - carry.size) * 4
+                raw = process.stdout.read(need_bytes)
+                new = np.frombuffer(raw[:len(raw) - len(raw) % 4], dtype=np.float32)
+                block = np.concatenate((carry, new)) if carry.size else new
+
+                if len(raw) < need_bytes:
+                    if block.size:
+                        yield block
+                    break
+
+                cut = self._find_cut(block, boundary_samples)
+                yield block[:cut]
+                carry = block[cut:]
+        finally:
+            process.stdout.close()
+            process.wait()
+            for thread in threads:
+                thread.join()
+
+        if process.returncode != 0:
+            error = b"".join(stderr_chunks).decode(errors="ignore").strip()
+            raise RuntimeError(f"Ошибка декодирования аудиофайла: {error}")
+
+    @staticmethod
+    def _feed_stdin(process, input_data):
+        try:
+            process.stdin.write(input_data)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    @staticmethod
+    def _find_cut(block, boundary_samples):
+        """Индекс начала самого тихого кадра в конце блока."""
+        tail = block[block.size - boundary_samples:]
+        n_frames = tail.size // BOUNDARY_FRAME
+        if n_frames == 0:
+            return block.size
+        frames = tail[:n_frames * BOUNDARY_FRAME].reshape(n_frames, BOUNDARY_FRAME)
+        quietest = int(np.argmin(np.einsum("ij,ij->i", frames, frames)))
+        return block.size - boundary_samples + quietest * BOUNDARY_FRAME
+
+    def process_stream(self, block_seconds=DEFAULT_BLOCK_SECONDS):
+        """
+        Потоковый цикл обработки: декодирование и предобработка блоками.
+        Память ограничена размером блока, а не длиной записи.
+        """
+        noise_profile = self.load_noise_profile()
+        preprocessor = StreamingAudioPreprocessor(
+            sr=SAMPLE_RATE, noise_profile=noise_profile, stage_overrides=self.stage_overrides
+        )
+        for block in self.iter_decoded_blocks(block_seconds):
+            block = preprocessor.process_block(block)
+            if self.preprocessing is None:
+                # Стадии выбраны по первому блоку и дальше не меняются
+                self.preprocessing = self.preprocessing_summary(preprocessor.stages, preprocessor.analysis)
+            yield block
+        if noise_profile is None:
+            self.save_noise_profile(preprocessor.noise_profile)
+
+    def preprocessing_summary(self, stages, analysis):
+        """Решение о предобработке для результата задачи."""
+        return {"stages": stages, "analysis": analysis, "overrides": self.stage_overrides}
+
+    def load_noise_profile(self):
+        """Сохранённый профиль шума источника или None."""
+        if not self.noise_profile_path:
+            return None
+        noise_profile = NoiseProfile.load(self.noise_profile_path)
+        return noise_profile if noise_profile is not None and noise_profile.matches(SAMPLE_RATE) else None
+
+    def save_noise_profile(self, noise_profile):
+        if self.noise_profile_path and noise_profile is not None:
+            noise_profile.save(self.noise_profile_path)
+
     def preprocess(self):
         """Предобработка аудиофайл"""
-        if not self.output_audio:
-            return None, "Нет выходного аудиофайла после конвертации"
+        if self.output_audio is None or self.output_audio.size == 0:
+            return None, "Нет выходного аудиопотока после декодирования"
 
         try:
-            y, sr = librosa.load(io.BytesIO(self.output_audio), sr=16000)
+            y, sr = self.output_audio, SAMPLE_RATE
 
-            # Изменение громкости и удаление пиков
-            y = AdvancedAudioProcessor.preprocess_audio_volume(y)
+            # Анализ записи (отношение речи к фону, клиппинг, спектр) решает, какие стадии нужны
+            with timed(self.timings, "analysis"):
+                features = AudioFeatures(y)
+                analysis = AudioAnalysis(y, sr, features=features)
+                stages = analysis.choose_stages(self.stage_overrides)
+            self.preprocessing = self.preprocessing_summary(stages, analysis.summary())
+
+            # Удаление пиков и изменение громкости
+            if stages["spikes"]:
+                with timed(self.timings, "spikes"):
+                    y = AdvancedAudioProcessor.remove_spikes(y, analysis.spikes)
+            if stages["volume"] and 0 < analysis.rms < analysis.target_rms:
+                with timed(self.timings, "volume"):
+                    y = AdvancedAudioProcessor.increase_volume(y, current_rms=analysis.rms,
+                                                               target_rms=analysis.target_rms)
 
             # Полосовой фильтр с проверкой корректности частот
-            y = AdvancedAudioProcessor.bandpass_filter(y, sr)
+            if stages["bandpass"]:
+                with timed(self.timings, "bandpass"):
+                    y = AdvancedAudioProcessor.bandpass_filter(y, sr)
+
+            # Покадровые признаки считаются один раз и переиспользуются следующими шагами;
+            # если ни одна стадия сигнал не изменила, подходят признаки анализа
+            if y is self.output_audio:
+                self.features = features
+            else:
+                with timed(self.timings, "features"):
+                    self.features = AudioFeatures(y)
 
-            # Спектральное вычитание (поиск тихого участка и удаление шума)
-            y = AdvancedAudioProcessor.remove_noise(y, sr)
+            # Спектральное вычитание: профиль шума источника или самого шумного тихого участка записи
+            if stages["denoise"]:
+                with timed(self.timings, "denoise"):
+                    noise_profile = self.load_noise_profile()
+                    if noise_profile is None:
+                        noise_profile = AdvancedAudioProcessor.estimate_noise_profile(y, sr, features=self.features)
+                        self.save_noise_profile(noise_profile)
+                    if noise_profile is not None:
+                        y = AdvancedAudioProcessor.remove_noise(
+                            y, sr, noise_profile=noise_profile, workers=self.denoise_workers
+                        )
 
             return y, None
 
@@ -51,11 +244,12 @@ class AudioProcessor:
             return None, str(e)
 
     def process(self):
-        """Полный цикл обработки аудиофайла: конвертация, предобработка."""
-        # Конфертируем в wav
-        converted_audio, error = self.convert_to_wav()
-        if not converted_audio:
-            return None, error
+        """Полный цикл обработки аудиофайла: декодирование, предобработка."""
+        # Декодируем в PCM
+        with timed(self.timings, "decode"):
+            decoded_audio, error = self.decode_audio()
+        if decoded_audio is None or decoded_audio.size == 0:
+            return None, error or "Аудиопоток не содержит данных"
 
         # Делаем предобработку аудиозаписи
         preprocessed_audio, error = self.preprocess()
@@ -63,3 +257,44 @@ class AudioProcessor:
             return None, error
 
         return preprocessed_audio, error
+
+    def speech_windows(self, audio, max_window_seconds=30):
+        """
+        Находит участки речи по уже посчитанным признакам и упаковывает их в окна для Whisper.
+        """
+        with timed(self.timings, "vad"):
+            segments = AdvancedAudioProcessor.find_speech_segments(audio, SAMPLE_RATE, features=self.features)
+            return pack_speech_windows(audio, segments, SAMPLE_RATE, max_window_seconds, features=self.features)
+
+
+def preprocess_upload(upload, vad_window_seconds=None, noise_profile_path=None, denoise_workers=1,
+                      stage_overrides=None, shard_seconds=None):
+    """
+    Полный цикл обработки загрузки. Вызывается в пуле процессов, поэтому функция модульная.
+    Возвращает (список SpeechWindow, timings, preprocessing, error). Без VAD вся запись - одно окно,
+    а с shard_seconds длинная запись сразу делится на шарды для ShardedTranscriber.
+    timings - время шагов, длительность записи (audio_seconds) и пик памяти (peak_memory_bytes).
+    preprocessing - выбранные стадии предобработки и показатели анализа записи.
+    """
+    processor = AudioProcessor(upload, noise_profile_path, denoise_workers, stage_overrides)
+    tracemalloc.start()
+    try:
+        audio, error = processor.process()
+        if audio is not None:
+            if vad_window_seconds:
+                windows = processor.speech_windows(audio, vad_window_seconds)
+            else:
+                windows = [whole_audio_window(audio, SAMPLE_RATE)]
+                if shard_seconds:
+                    # Границы шардов ищутся здесь, по уже посчитанным признакам, а не в процессе сервера
+                    with timed(processor.timings, "shards"):
+                        windows = shard_windows(windows, SAMPLE_RATE, shard_seconds, features=processor.features)
+        # Считаются выделения Python и NumPy; процесс пула обрабатывает одну задачу за раз
+        processor.timings["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    if audio is None:
+        return None, processor.timings, processor.preprocessing, error
+    processor.timings["audio_seconds"] = audio.size / SAMPLE_RATE
+    return windows, processor.timings, processor.preprocessing, None
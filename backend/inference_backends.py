@@ -0,0 +1,103 @@
+import torch
+
+from transformers import WhisperForConditionalGeneration, WhisperProcessor, pipeline
+from transformers.models.whisper.tokenization_whisper import TO_LANGUAGE_CODE
+
+
+class HFPipelineBackend:
+    def __init__(self, model_name, language, device, quantize=False, batch_size=4):
+        """
+        Whisper через пайплайн transformers.
+        quantize=True - динамическое квантование линейных слоёв в int8 (только CPU).
+        """
+        # model_name может быть локальным снимком из save_snapshot: веса в safetensors
+        # отображаются в память (mmap) без промежуточной копии в ОЗУ
+        self.model = WhisperForConditionalGeneration.from_pretrained(model_name, low_cpu_mem_usage=True)
+        if quantize:
+            if device != "cpu":
+                raise ValueError("Квантование int8 поддерживается только на CPU")
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = self.model.to(device).eval()
+
+        # Токенизатор и экстрактор признаков загружаются вместе одним процессором
+        self.processor = WhisperProcessor.from_pretrained(model_name, language=language, task="transcribe")
+        self.tokenizer = self.processor.tokenizer
+        self.feature_extractor = self.processor.feature_extractor
+
+        self.pipeline = pipeline(
+            "automatic-speech-recognition",
+            model=self.model,
+            tokenizer=self.tokenizer,
+            feature_extractor=self.feature_extractor,
+            device=0 if device == "cuda" else -1,
+            batch_size=batch_size
+        )
+
+    def __call__(self, audio, return_timestamps=True, batch_size=None):
+        kwargs = {"batch_size": batch_size} if batch_size else {}
+        return self.pipeline(audio, return_timestamps=return_timestamps, **kwargs)
+
+
+class CTranslate2Backend:
+    def __init__(self, model_name, language, device, compute_type=None, beam_size=5):
+        """
+        Whisper на CTranslate2 (пакет faster-whisper, ставится отдельно).
+        По умолчанию на CPU веса в int8, на GPU - float16.
+        """
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("Для бэкенда ctranslate2 установите пакет faster-whisper")
+
+        # Для моделей openai/whisper-* faster-whisper сам скачивает сконвертированную версию
+        if model_name.startswith("openai/whisper-"):
+            model_name = model_name[len("openai/whisper-"):]
+        compute_type = compute_type or ("int8" if device == "cpu" else "float16")
+
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type)
+        self.language = TO_LANGUAGE_CODE.get(language, language)
+        self.beam_size = beam_size
+
+    def __call__(self, audio, return_timestamps=True, batch_size=None):
+        """Повторяет формат ответа пайплайна transformers: {"text", "chunks"}."""
+        if isinstance(audio, list):
+            return [self(item, return_timestamps) for item in audio]
+
+        segments, _ = self.model.transcribe(audio, language=self.language, beam_size=self.beam_size)
+        chunks = [{"timestamp": (segment.start, segment.end), "text": segment.text} for segment in segments]
+        return {"text": "".join(chunk["text"] for chunk in chunks), "chunks": chunks}
+
+
+# Доступные бэкенды: имя -> (класс, дополнительные параметры)
+BACKENDS = {
+    "hf": (HFPipelineBackend, {}),
+    "hf-int8": (HFPipelineBackend, {"quantize": True}),
+    "ctranslate2": (CTranslate2Backend, {}),
+}
+
+
+def create_backend(name, model_name, language, device):
+    """Создаёт бэкенд инференса по имени из BACKENDS."""
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд инференса: {name}. Доступны: {', '.join(BACKENDS)}")
+    backend_class, options = BACKENDS[name]
+    return backend_class(model_name, language, device, **options)
+
+
+def save_snapshot(model_name, directory, language="russian"):
+    """
+    Сохраняет модель, токенизатор и экстрактор признаков в локальный каталог (веса в safetensors).
+    Каталог затем передаётся как model_name, и сервер стартует без обращения к сети.
+    """
+    model = WhisperForConditionalGeneration.from_pretrained(model_name, low_cpu_mem_usage=True)
+    model.save_pretrained(directory, safe_serialization=True)
+    WhisperProcessor.from_pretrained(model_name, language=language, task="transcribe").save_pretrained(directory)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        sys.exit("Использование: python inference_backends.py <модель> <каталог снимка>")
+    save_snapshot(sys.argv[1], sys.argv[2])
+    print(f"Снимок {sys.argv[1]} сохранён в {sys.argv[2]}")
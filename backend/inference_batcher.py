@@ -0,0 +1,81 @@
+import asyncio
+
+from stage_stats import StageStats
+from metrics import timed, STAGE_SECONDS
+
+class InferenceBatcher:
+    def __init__(self, transcriber=None, max_batch_size=4, max_wait_ms=50, max_pending=8):
+        """
+        Собирает аудио из разных задач в батчи для одного вызова модели.
+        Батч отправляется, когда набрано max_batch_size записей или прошло max_wait_ms
+        с момента появления первой записи. Очередь ожидающих записей ограничена max_pending.
+        Если transcriber не передан, записи копятся в очереди до вызова set_transcriber.
+        """
+        self.transcriber = None
+        self.load_error = None
+        self.ready = asyncio.Event()
+        if transcriber is not None:
+            self.set_transcriber(transcriber)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = asyncio.Queue(maxsize=max_pending)
+        self.stats = StageStats("inference", concurrency=1)
+
+        # Запускаем цикл формирования батчей
+        self.batching_task = asyncio.create_task(self.run())
+
+    def set_transcriber(self, transcriber, error=None):
+        """
+        Передаёт загруженную модель и запускает распознавание накопленных записей.
+        Если модель загрузить не удалось, все записи завершаются с ошибкой error.
+        """
+        self.transcriber = transcriber
+        self.load_error = error
+        self.ready.set()
+
+    async def submit(self, audio):
+        """
+        Ставит запись в очередь на распознавание и возвращает future с (transcript, error).
+        Если очередь заполнена, ждёт свободного места.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.pending.put((audio, future))
+        return future
+
+    async def transcribe(self, audio):
+        """Ставит запись в очередь на распознавание и ждёт результат (transcript, error)."""
+        return await (await self.submit(audio))
+
+    async def collect_batch(self):
+        """Ждёт первую запись и добирает батч до лимита по размеру или времени."""
+        batch = [await self.pending.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.pending.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        """Бесконечный цикл: батч → один вызов модели → раздача результатов по задачам."""
+        await self.ready.wait()
+        while True:
+            batch = await self.collect_batch()
+            audios = [audio for audio, _ in batch]
+            try:
+                if self.load_error:
+                    raise RuntimeError(self.load_error)
+                timings = {}
+                with self.stats.track(items=len(batch)), timed(timings, "inference_batch"):
+                    results = await asyncio.to_thread(self.transcriber.transcribe_batch, audios)
+                STAGE_SECONDS.observe(timings["inference_batch"], stage="inference_batch")
+            except Exception as e:
+                results = [(None, str(e))] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
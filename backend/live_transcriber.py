@@ -0,0 +1,248 @@
+import asyncio
+import re
+
+import ffmpeg
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# Форматы сырого PCM, которые при 16 кГц разбираются без ffmpeg: формат -> тип отсчёта и нормировка
+PCM_FORMATS = {
+    "pcm_f32le": (np.float32, 1.0),
+    "pcm_s16le": (np.int16, 32768.0),
+}
+
+# Формат ffmpeg для сырого PCM другой частоты
+PCM_FFMPEG_FORMATS = {"pcm_f32le": "f32le", "pcm_s16le": "s16le"}
+
+# Порция вывода ffmpeg (0.1 с float32 при 16 кГц)
+DECODER_READ_BYTES = SAMPLE_RATE // 10 * 4
+
+
+class PcmDecoder:
+    def __init__(self, on_audio, audio_format="pcm_f32le"):
+        """Сырой моно PCM 16 кГц: отсчёты переводятся в float32."""
+        self.on_audio = on_audio
+        self.dtype, self.scale = PCM_FORMATS[audio_format]
+        self.remainder = b""
+
+    async def write(self, data):
+        data = self.remainder + data
+        item_size = np.dtype(self.dtype).itemsize
+        usable = len(data) - len(data) % item_size
+        self.remainder = data[usable:]
+        audio = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32) / self.scale
+        if audio.size:
+            self.on_audio(audio)
+
+    async def close(self):
+        pass
+
+    async def abort(self):
+        pass
+
+
+class FfmpegStreamDecoder:
+    def __init__(self, on_audio, input_options=None):
+        """
+        Сжатый поток (Opus в Ogg или WebM и любой другой формат, который ffmpeg читает из пайпа).
+        Декодированный PCM отдаётся в on_audio порциями по мере готовности.
+        input_options - параметры входа ffmpeg, например формат и частота сырого PCM:
+        ресемплер ffmpeg сохраняет состояние фильтра между фреймами, стыков на границах нет.
+        """
+        self.on_audio = on_audio
+        self.input_options = input_options or {}
+        self.process = None
+        self.reader = None
+
+    async def start(self):
+        args = (
+            ffmpeg.input('pipe:0', **self.input_options)
+            .output('pipe:1', format='f32le', acodec='pcm_f32le', ar=SAMPLE_RATE, ac=1)
+            .global_args('-loglevel', 'error')
+            .compile()
+        )
+        self.process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self.reader = asyncio.create_task(self.read_stdout())
+
+    async def read_stdout(self):
+        remainder = b""
+        while chunk := await self.process.stdout.read(DECODER_READ_BYTES):
+            chunk = remainder + chunk
+            usable = len(chunk) - len(chunk) % 4
+            remainder = chunk[usable:]
+            if usable:
+                self.on_audio(np.frombuffer(chunk[:usable], dtype=np.float32))
+
+    async def write(self, data):
+        if self.process is None:
+            await self.start()
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+
+    async def close(self):
+        """Закрывает вход ffmpeg и ждёт, пока будет отдан весь декодированный звук."""
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        await self.reader
+        await self.process.wait()
+
+    async def abort(self):
+        """Обрыв потока: останавливает ffmpeg, не дожидаясь остатка звука."""
+        if self.process is None:
+            return
+        if not self.process.stdin.is_closing():
+            self.process.stdin.close()
+        if self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+        await self.process.wait()
+        self.reader.cancel()
+        await asyncio.gather(self.reader, return_exceptions=True)
+
+
+def create_decoder(on_audio, audio_format="pcm_f32le", sample_rate=SAMPLE_RATE):
+    """Декодер живого потока: PCM 16 кГц разбирается на месте, остальное - через ffmpeg."""
+    if audio_format in PCM_FORMATS:
+        if sample_rate == SAMPLE_RATE:
+            return PcmDecoder(on_audio, audio_format)
+        return FfmpegStreamDecoder(
+            on_audio, {"format": PCM_FFMPEG_FORMATS[audio_format], "ar": sample_rate, "ac": 1}
+        )
+    return FfmpegStreamDecoder(on_audio)
+
+
+def normalize(text):
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class LiveTranscriber:
+    def __init__(self, transcribe, step_seconds=2.0, max_buffer_seconds=25.0, sr=SAMPLE_RATE):
+        """
+        Потоковое распознавание со скользящим окном.
+
+        transcribe - корутина audio -> ({"text", "chunks"}, error), например InferenceBatcher.transcribe.
+        Каждые step_seconds нового звука окно (ещё не зафиксированный звук) распознаётся заново.
+        Фрагмент фиксируется, когда он и все фрагменты перед ним совпали в двух распознаваниях
+        подряд и за ним уже есть продолжение; окно после этого начинается с конца фрагмента.
+        Если окно длиннее max_buffer_seconds, фиксируется всё, кроме последнего фрагмента.
+        """
+        self.transcribe = transcribe
+        self.sr = sr
+        self.step = int(step_seconds * sr)
+        self.max_buffer = int(max_buffer_seconds * sr)
+
+        self.buffer = np.empty(0, dtype=np.float32)
+        # Начало окна в потоке (отсчёты) и размер окна при последнем распознавании
+        self.buffer_start = 0
+        self.transcribed_size = 0
+        # Незафиксированные фрагменты прошлого распознавания и зафиксированные сегменты
+        self.hypothesis = []
+        self.segments = []
+
+        self.finished = False
+        self.ready = asyncio.Event()
+
+    def feed(self, audio):
+        """Добавляет декодированный звук в окно."""
+        self.buffer = np.concatenate((self.buffer, audio))
+        if self.buffer.size - self.transcribed_size >= self.step:
+            self.ready.set()
+
+    def finish(self):
+        """Поток закончился: остаток окна распознаётся и фиксируется целиком."""
+        self.finished = True
+        self.ready.set()
+
+    async def iter_events(self, task_id):
+        """
+        Отдаёт события по мере распознавания: "segment" - зафиксированный фрагмент,
+        "partial" - текущий нефиксированный хвост, в конце - "result" со всей расшифровкой.
+        """
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            final = self.finished
+
+            committed, error = await self.advance(final)
+            if error:
+                yield {"type": "result", "task_id": task_id, "error": error}
+                return
+            for segment in committed:
+                yield {"type": "segment", "task_id": task_id, **segment}
+
+            if final:
+                yield {
+                    "type": "result",
+                    "task_id": task_id,
+                    "transcript": " ".join(segment["text"] for segment in self.segments),
+                    "segments": self.segments,
+                }
+                return
+
+            yield {
+                "type": "partial",
+                "task_id": task_id,
+                "start": self.buffer_start / self.sr,
+                "text": " ".join(chunk["text"] for chunk in self.hypothesis),
+            }
+
+            # Пока шло распознавание, мог накопиться следующий шаг
+            if self.buffer.size - self.transcribed_size >= self.step:
+                self.ready.set()
+
+    async def advance(self, final=False):
+        """Распознаёт текущее окно и фиксирует устоявшиеся фрагменты. Возвращает (новые сегменты, error)."""
+        audio = self.buffer
+        if audio.size == 0:
+            return [], None
+
+        output, error = await self.transcribe(audio)
+        if output is None:
+            return [], error
+
+        offset = self.buffer_start / self.sr
+        chunks = []
+        for chunk in output["chunks"]:
+            text = chunk["text"].strip()
+            if not text:
+                continue
+            end = chunk["end"] if chunk["end"] is not None else audio.size / self.sr
+            chunks.append({"start": offset + chunk["start"], "end": offset + end, "text": text})
+
+        if final:
+            stable = len(chunks)
+        else:
+            # Совпавший с прошлым распознаванием префикс, кроме последнего фрагмента
+            stable = 0
+            while (stable < min(len(chunks) - 1, len(self.hypothesis))
+                   and normalize(chunks[stable]["text"]) == normalize(self.hypothesis[stable]["text"])):
+                stable += 1
+            if audio.size > self.max_buffer:
+                stable = max(stable, len(chunks) - 1)
+
+        committed = chunks[:stable]
+        self.segments.extend(committed)
+        self.hypothesis = chunks[stable:]
+
+        # Окно начинается с конца последнего зафиксированного фрагмента
+        if committed:
+            cut = int(round(committed[-1]["end"] * self.sr)) - self.buffer_start
+        elif not chunks and audio.size > self.max_buffer:
+            # Долгая тишина: оставляем только последний шаг
+            cut = audio.size - self.step
+        else:
+            cut = 0
+        cut = min(max(cut, 0), audio.size)
+        self.buffer = self.buffer[cut:]
+        self.buffer_start += cut
+        self.transcribed_size = audio.size - cut
+        return committed, None
@@ -0,0 +1,144 @@
+import math
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, math.inf)
+
+
+def format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets) if buckets[-1] == math.inf else tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        if key not in self.values:
+            self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts, _, _ = state = self.values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, (counts, total, count) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = format_labels(self.label_names, label_values, [("le", format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Набор метрик процесса, который отдаётся в текстовом формате Prometheus."""
+        self.metrics = []
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus (version 0.0.4)."""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "transcriber_stage_seconds", "Время стадий обработки задачи, секунды", ["stage"]
+)
+TASK_RTF = REGISTRY.histogram(
+    "transcriber_task_rtf", "Время обработки задачи, делённое на длительность записи",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10),
+)
+TASK_PEAK_MEMORY = REGISTRY.histogram(
+    "transcriber_task_peak_memory_bytes", "Пик памяти предобработки задачи (выделения Python и NumPy), байты",
+    buckets=tuple(2 ** power * 1024 * 1024 for power in range(4, 14)),
+)
+TASKS = REGISTRY.counter(
+    "transcriber_tasks_total", "Завершённые задачи по итогу: ok, error, cached, rejected", ["status"]
+)
+QUEUE_SIZE = REGISTRY.gauge("transcriber_queue_size", "Заполненность очередей", ["queue"])
+QUEUE_WAIT_ESTIMATE = REGISTRY.gauge(
+    "transcriber_queue_wait_estimate_seconds", "Оценка ожидания новой задачи обычного приоритета, секунды"
+)
+STAGE_UTILIZATION = REGISTRY.gauge("transcriber_stage_utilization", "Доля занятого времени слотов стадии", ["stage"])
+MODEL_READY = REGISTRY.gauge("transcriber_model_ready", "1, если модель загружена и прогрета")
+DELIVERY_PENDING = REGISTRY.gauge(
+    "transcriber_delivery_pending", "Недоставленные результаты по клиентским точкам", ["endpoint"]
+)
+
+
+@contextmanager
+def timed(timings, name):
+    """Добавляет время выполнения блока к timings[name] (секунды)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
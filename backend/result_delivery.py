@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import websockets
+
+from metrics import STAGE_SECONDS
+
+class EndpointSender:
+    def __init__(self, uri, max_buffer=1000, initial_backoff=0.5, max_backoff=30):
+        """
+        Постоянное соединение с одной клиентской точкой. Результаты копятся в буфере
+        и отправляются по одному соединению; точка подтверждает каждый результат сообщением
+        {"type": "ack", "task_id": ...}. При обрыве соединение восстанавливается
+        с экспоненциальной задержкой, а неподтверждённые результаты отправляются заново.
+        """
+        self.uri = uri
+        self.max_buffer = max_buffer
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        # Ещё не отправленные результаты и отправленные, но не подтверждённые (task_id -> результат)
+        self.buffer = deque()
+        self.unacked = {}
+        self.has_data = asyncio.Event()
+
+        # Запускаем цикл отправки
+        self.sending_task = asyncio.create_task(self.run())
+
+    def send(self, result):
+        """Ставит результат в буфер отправки."""
+        if self.buffer and len(self.buffer) + len(self.unacked) >= self.max_buffer:
+            dropped, _ = self.buffer.popleft()
+            print(f"Буфер доставки {self.uri} переполнен, отброшен результат {dropped.get('task_id')}")
+        # Время постановки в буфер - для метрики задержки доставки
+        self.buffer.append((result, time.perf_counter()))
+        self.has_data.set()
+
+    def pending(self):
+        """Число недоставленных (неотправленных и неподтверждённых) результатов."""
+        return len(self.buffer) + len(self.unacked)
+
+    async def run(self):
+        """Держит соединение открытым и отправляет результаты по мере появления."""
+        backoff = self.initial_backoff
+        while True:
+            if not self.pending():
+                self.has_data.clear()
+                await self.has_data.wait()
+            try:
+                async with websockets.connect(self.uri) as websocket:
+                    backoff = self.initial_backoff
+                    # Результаты, не подтверждённые в прошлом соединении, отправляются первыми
+                    self.buffer.extendleft(reversed(list(self.unacked.values())))
+                    self.unacked.clear()
+                    receiving = asyncio.create_task(self.receive_acks(websocket))
+                    try:
+                        await self.send_buffered(websocket, receiving)
+                    finally:
+                        receiving.cancel()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Любая ошибка - повод переподключиться, а не остановить доставку на эту точку
+                print(f"Ошибка доставки результатов на {self.uri}: {e!r}. Повтор через {backoff} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def send_buffered(self, websocket, receiving):
+        """Отправляет результаты из буфера, пока соединение живо (его закрытие замечает receiving)."""
+        while True:
+            if not self.buffer:
+                self.has_data.clear()
+                waiter = asyncio.create_task(self.has_data.wait())
+                await asyncio.wait({waiter, receiving}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if receiving.done():
+                    receiving.result()
+                    raise ConnectionError("клиентская точка закрыла соединение")
+                continue
+
+            # Результат остаётся неподтверждённым, пока точка не ответит ack
+            result, queued_at = self.buffer.popleft()
+            try:
+                message = json.dumps(result)
+            except (TypeError, ValueError) as e:
+                print(f"Результат {result.get('task_id')} не сериализуется и отброшен: {e}")
+                continue
+            self.unacked[result.get("task_id")] = (result, queued_at)
+            await websocket.send(message)
+
+    async def receive_acks(self, websocket):
+        """Принимает подтверждения доставки и убирает подтверждённые результаты."""
+        async for message in websocket:
+            ack = json.loads(message)
+            if ack.get("type") != "ack":
+                continue
+            entry = self.unacked.pop(ack.get("task_id"), None)
+            if entry is not None:
+                STAGE_SECONDS.observe(time.perf_counter() - entry[1], stage="delivery")
+
+
+class ResultDelivery:
+    def __init__(self, max_buffer=1000, max_backoff=30):
+        """
+        Доставка результатов клиентским серверам. На каждую точку - одно постоянное соединение.
+        """
+        self.max_buffer = max_buffer
+        self.max_backoff = max_backoff
+        self.senders = {}
+
+    def send(self, uri, result):
+        """Отправляет результат на клиентскую точку uri (без ожидания доставки)."""
+        sender = self.senders.get(uri)
+        if sender is None:
+            sender = EndpointSender(uri, max_buffer=self.max_buffer, max_backoff=self.max_backoff)
+            self.senders[uri] = sender
+        sender.send(result)
+
+    def pending(self):
+        """Число неотправленных результатов по каждой точке."""
+        return {uri: sender.pending() for uri, sender in self.senders.items()}
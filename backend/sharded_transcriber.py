@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_preprocessing import AdvancedAudioProcessor, AudioFeatures
+from speech_windows import SpeechWindow, stitch_transcripts
+
+# Экземпляр модели внутри процесса пула
+_worker_transcriber = None
+
+
+def _init_worker(model_name, language, backend, torch_threads):
+    """Загружает собственную модель в процессе пула."""
+    global _worker_transcriber
+    import torch
+    from whisper_transcriber import WhisperTranscriber
+
+    torch.set_num_threads(torch_threads)
+    _worker_transcriber = WhisperTranscriber(model_name=model_name, language=language, backend=backend)
+
+
+def _transcribe_shard(audio):
+    return _worker_transcriber.transcribe_with_timestamps(audio)
+
+
+def find_shard_bounds(audio, sr, shard_seconds=300, search_seconds=30, features=None):
+    """
+    Делит запись на шарды примерно по shard_seconds. Граница переносится в середину
+    ближайшего тихого участка в пределах search_seconds, если такой есть.
+    """
+    shard_samples = int(shard_seconds * sr)
+    if audio.size <= shard_samples:
+        return [(0, audio.size)]
+
+    if features is None:
+        features = AudioFeatures(audio)
+    quiet_segments = AdvancedAudioProcessor.find_quiet_segments(audio, sr, features=features)
+    quiet_points = np.array([(start + end) // 2 for start, end in quiet_segments], dtype=np.int64)
+    search = int(search_seconds * sr)
+
+    bounds = []
+    start = 0
+    while audio.size - start > shard_samples:
+        target = start + shard_samples
+        cut = target
+        if quiet_points.size:
+            nearest = quiet_points[np.argmin(np.abs(quiet_points - target))]
+            if abs(nearest - target) <= search and nearest > start:
+                cut = int(nearest)
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, audio.size))
+    return bounds
+
+
+def shard_windows(windows, sr, shard_seconds=300, features=None):
+    """
+    Разбивает слишком длинные окна (запись целиком без VAD) на шарды по тихим участкам.
+    Окна VAD уже короткие и становятся шардами как есть.
+    features - признаки единственного окна (всей записи), если уже посчитаны.
+    """
+    shards = []
+    for window in windows:
+        if window.audio.size <= shard_seconds * sr or len(window.pieces) != 1:
+            shards.append(window)
+            continue
+        _, original_start, _ = window.pieces[0]
+        for start, end in find_shard_bounds(window.audio, sr, shard_seconds, features=features):
+            shards.append(SpeechWindow(window.audio[start:end], [(0, original_start + start, end - start)], sr))
+    return shards
+
+
+class ShardedTranscriber:
+    def __init__(self, model_name, language, backend="hf", workers=2, shard_seconds=300, sr=16000):
+        """
+        Параллельное распознавание длинных записей: шарды раздаются пулу процессов,
+        в каждом из которых загружена своя модель.
+        """
+        self.workers = workers
+        self.shard_seconds = shard_seconds
+        self.sr = sr
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, language, backend, torch_threads),
+        )
+
+    def is_long(self, windows):
+        """Стоит ли распознавать запись по шардам."""
+        return sum(window.audio.size for window in windows) > self.shard_seconds * self.sr
+
+    async def transcribe(self, windows):
+        """
+        Распознает окна записи параллельно и склеивает результат в исходном порядке.
+        Возвращает (transcript, segments, error).
+        """
+        loop = asyncio.get_running_loop()
+        # Обычно запись уже поделена в процессе предобработки (preprocess_upload с shard_seconds).
+        # Иначе это одно окно со всей записью: поиск тихих участков не должен блокировать цикл событий
+        shards = windows
+        if len(windows) == 1:
+            shards = await asyncio.to_thread(shard_windows, windows, self.sr, self.shard_seconds)
+        outputs = await asyncio.gather(
+            *(loop.run_in_executor(self.pool, _transcribe_shard, shard.audio) for shard in shards)
+        )
+        return stitch_transcripts(shards, outputs)
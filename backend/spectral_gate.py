@@ -0,0 +1,148 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft
+from scipy.ndimage import convolve1d
+from scipy.signal import get_window
+
+# Параметры STFT (как у noisereduce по умолчанию): окно 64 мс и шаг 16 мс при 16 кГц
+N_FFT = 1024
+HOP_LENGTH = 256
+
+# Длина блока при поблочной обработке и перекрытие блоков (сек)
+DEFAULT_CHUNK_SECONDS = 60
+CHUNK_PADDING_SECONDS = 0.5
+
+
+def stft(audio, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    Спектр кадров окна Ханна (кадры x частоты, complex64). Кадр i центрирован на отсчёте
+    i * hop_length, края сигнала дополнены нулями.
+    """
+    n_frames = audio.size // hop_length + 1
+    padded = np.zeros((n_frames - 1) * hop_length + n_fft, dtype=np.float32)
+    padded[n_fft // 2:n_fft // 2 + audio.size] = audio
+    frames = sliding_window_view(padded, n_fft)[::hop_length]
+    return fft.rfft(frames * get_window("hann", n_fft).astype(np.float32), axis=1)
+
+
+def istft(spectrum, n_samples, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """Обратное преобразование к stft: сложение кадров с перекрытием и нормировкой на окно."""
+    if n_fft % hop_length:
+        raise ValueError("n_fft должен быть кратен hop_length")
+    window = get_window("hann", n_fft).astype(np.float32)
+    frames = fft.irfft(spectrum, n=n_fft, axis=1) * window
+    n_frames = frames.shape[0]
+    overlap = n_fft // hop_length
+
+    # Кадр i занимает блоки i..i+overlap-1 по hop_length отсчётов
+    output = np.zeros((n_frames + overlap - 1, hop_length), dtype=np.float32)
+    norm = np.zeros_like(output)
+    blocks = frames.reshape(n_frames, overlap, hop_length)
+    window_squared = (window ** 2).reshape(overlap, hop_length)
+    for k in range(overlap):
+        output[k:k + n_frames] += blocks[:, k]
+        norm[k:k + n_frames] += window_squared[k]
+    output = output.ravel() / np.maximum(norm.ravel(), 1e-8)
+    return output[n_fft // 2:n_fft // 2 + n_samples]
+
+
+def smoothing_kernel(n_grad):
+    """Треугольное ядро сглаживания маски длиной 2 * n_grad + 1 (как в noisereduce)."""
+    kernel = np.concatenate([np.arange(1, n_grad + 2), np.arange(n_grad, 0, -1)]).astype(np.float32)
+    return kernel / kernel.sum()
+
+
+def profile_path(directory, source):
+    """Файл профиля шума источника source (микрофон, канал) в каталоге directory."""
+    return os.path.join(directory, hashlib.blake2b(source.encode(), digest_size=16).hexdigest() + ".npz")
+
+
+class NoiseProfile:
+    def __init__(self, mean_db, std_db, sr, n_fft=N_FFT):
+        """
+        Профиль стационарного шума: средний уровень и его разброс (дБ) на каждой частоте STFT.
+        Профиль одного источника можно сохранить и применять к следующим его записям.
+        """
+        self.mean_db = np.asarray(mean_db, dtype=np.float32)
+        self.std_db = np.asarray(std_db, dtype=np.float32)
+        self.sr = sr
+        self.n_fft = n_fft
+
+    @classmethod
+    def from_noise(cls, noise, sr, n_fft=N_FFT, hop_length=HOP_LENGTH):
+        """Профиль по образцу шума."""
+        power = np.abs(stft(noise, n_fft, hop_length)) ** 2
+        power_db = 10 * np.log10(power + np.finfo(np.float32).tiny)
+        return cls(power_db.mean(axis=0), power_db.std(axis=0), sr, n_fft)
+
+    def threshold(self, n_std_thresh=1.5):
+        """Порог мощности на каждой частоте: всё, что ниже, считается шумом."""
+        return 10 ** ((self.mean_db + n_std_thresh * self.std_db) / 10)
+
+    def matches(self, sr, n_fft=N_FFT):
+        return self.sr == sr and self.n_fft == n_fft
+
+    def save(self, path):
+        """Сохраняет профиль; файл заменяется атомарно, профиль могут читать другие процессы."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, mean_db=self.mean_db, std_db=self.std_db, sr=self.sr, n_fft=self.n_fft)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Загружает профиль или возвращает None, если файла нет или он повреждён."""
+        try:
+            with np.load(path) as data:
+                return cls(data["mean_db"], data["std_db"], int(data["sr"]), int(data["n_fft"]))
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def spectral_gate(audio, sr, noise_profile, n_std_thresh=1.5, prop_decrease=0.8, freq_mask_smooth_hz=500,
+                  time_mask_smooth_ms=50, hop_length=HOP_LENGTH, chunk_seconds=DEFAULT_CHUNK_SECONDS, workers=1):
+    """
+    Стационарное спектральное подавление шума по профилю. Спектр каждого блока считается
+    один раз: по нему строится маска (бин громче порога профиля - сигнал, остальное ослабляется
+    на prop_decrease), и он же после умножения на сглаженную маску возвращается во временную область.
+
+    Запись обрабатывается блоками по chunk_seconds с перекрытием, поэтому память не зависит
+    от длины записи; при workers > 1 блоки обрабатываются параллельно в потоках
+    (БПФ и операции над массивами отпускают GIL).
+    """
+    n_fft = noise_profile.n_fft
+    threshold = noise_profile.threshold(n_std_thresh).astype(np.float32)
+    freq_kernel = smoothing_kernel(int(freq_mask_smooth_hz / (sr / (n_fft / 2))))
+    time_kernel = smoothing_kernel(int(time_mask_smooth_ms / (hop_length / sr * 1000)))
+
+    audio = np.asarray(audio, dtype=np.float32)
+    output = np.empty_like(audio)
+    # Границы блоков кратны шагу STFT: кадры блока совпадают с кадрами всей записи
+    chunk = max(int(chunk_seconds * sr) // hop_length, 1) * hop_length if chunk_seconds else max(audio.size, 1)
+    padding = int(CHUNK_PADDING_SECONDS * sr) // hop_length * hop_length
+
+    def process_chunk(start):
+        end = min(start + chunk, audio.size)
+        padded_start, padded_end = max(start - padding, 0), min(end + padding, audio.size)
+        spectrum = stft(audio[padded_start:padded_end], n_fft, hop_length)
+
+        mask = (spectrum.real ** 2 + spectrum.imag ** 2 > threshold).astype(np.float32)
+        mask = convolve1d(mask, freq_kernel, axis=1, mode="constant")
+        mask = convolve1d(mask, time_kernel, axis=0, mode="constant")
+        spectrum *= mask * prop_decrease + (1.0 - prop_decrease)
+
+        denoised = istft(spectrum, padded_end - padded_start, n_fft, hop_length)
+        output[start:end] = denoised[start - padded_start:end - padded_start]
+
+    starts = range(0, audio.size, chunk)
+    if workers > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(process_chunk, starts))
+    else:
+        for start in starts:
+            process_chunk(start)
+    return output
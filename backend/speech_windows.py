@@ -0,0 +1,110 @@
+import numpy as np
+
+# Длинный участок речи режется в самой тихой точке последних CUT_SEARCH_SECONDS перед границей окна;
+# точка уточняется по кадрам CUT_FRAME отсчётов (25 мс при 16 кГц)
+CUT_SEARCH_SECONDS = 5.0
+CUT_FRAME = 400
+
+class SpeechWindow:
+    def __init__(self, audio, pieces, sr):
+        """
+        Окно для распознавания, склеенное из участков речи.
+        pieces - список (начало в окне, начало в исходной записи, длина) в отсчётах.
+        """
+        self.audio = audio
+        self.pieces = pieces
+        self.sr = sr
+
+    def to_original(self, seconds):
+        """Переводит время внутри окна во время исходной записи."""
+        if seconds is None:
+            return None
+        sample = int(seconds * self.sr)
+        window_start, original_start, length = self.pieces[0]
+        for piece in self.pieces:
+            if piece[0] > sample:
+                break
+            window_start, original_start, length = piece
+        return (original_start + min(max(sample - window_start, 0), length)) / self.sr
+
+
+def quietest_point(audio, start, end, features=None):
+    """
+    Отсчёт в [start, end], где сигнал тише всего. С признаками (AudioFeatures) сначала выбирается
+    кадр с наименьшим RMS, затем внутри него - самый тихий короткий кадр CUT_FRAME.
+    """
+    if features is not None:
+        frames = features.segment_frames(start, end)
+        rms = features.rms[frames]
+        if rms.size:
+            center = (frames.start + int(np.argmin(rms))) * features.hop_length
+            start, end = max(start, center - features.hop_length), min(end, center + features.hop_length)
+    n_frames = (end - start) // CUT_FRAME
+    if n_frames == 0:
+        return end
+    blocks = audio[start:start + n_frames * CUT_FRAME].reshape(n_frames, CUT_FRAME)
+    return start + int(np.argmin(np.einsum("ij,ij->i", blocks, blocks))) * CUT_FRAME
+
+
+def pack_speech_windows(audio, segments, sr, max_window_seconds=30, gap_seconds=0.2, features=None):
+    """
+    Упаковывает участки речи в окна не длиннее max_window_seconds.
+    Между участками вставляется gap_seconds тишины, длинные участки режутся на части
+    в паузах (см. quietest_point), а не посреди слова. features - признаки audio, если уже посчитаны.
+    """
+    max_samples = int(max_window_seconds * sr)
+    gap = np.zeros(int(gap_seconds * sr), dtype=audio.dtype)
+    search = min(int(CUT_SEARCH_SECONDS * sr), max_samples // 2)
+
+    # Участки длиннее окна режем на части
+    parts = []
+    for start, end in segments:
+        while end - start > max_samples:
+            limit = start + max_samples
+            cut = quietest_point(audio, limit - search, limit, features)
+            parts.append((start, cut))
+            start = cut
+        parts.append((start, end))
+
+    windows = []
+    current, pieces, length = [], [], 0
+    for start, end in parts:
+        if current and length + gap.size + (end - start) > max_samples:
+            windows.append(SpeechWindow(np.concatenate(current), pieces, sr))
+            current, pieces, length = [], [], 0
+        if current:
+            current.append(gap)
+            length += gap.size
+        pieces.append((length, start, end - start))
+        current.append(audio[start:end])
+        length += end - start
+
+    if current:
+        windows.append(SpeechWindow(np.concatenate(current), pieces, sr))
+    return windows
+
+
+def whole_audio_window(audio, sr):
+    """Вся запись одним окном (без VAD)."""
+    return SpeechWindow(audio, [(0, 0, audio.size)], sr)
+
+
+def stitch_transcripts(windows, outputs):
+    """
+    Собирает результаты распознавания окон в один текст и список фрагментов
+    с метками времени исходной записи. outputs - список ({"text", "chunks"}, error).
+    Возвращает (transcript, segments, error).
+    """
+    texts, segments = [], []
+    for window, (output, error) in zip(windows, outputs):
+        if output is None:
+            return None, None, error
+        if output["text"].strip():
+            texts.append(output["text"].strip())
+        for chunk in output["chunks"]:
+            segments.append({
+                "start": window.to_original(chunk["start"]),
+                "end": window.to_original(chunk["end"]),
+                "text": chunk["text"].strip(),
+            })
+    return " ".join(texts), segments, None
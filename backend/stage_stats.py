@@ -0,0 +1,39 @@
+import time
+from contextlib import contextmanager
+
+class StageStats:
+    def __init__(self, name, concurrency):
+        """
+        Статистика загрузки стадии конвейера: сколько времени её слоты были заняты работой.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.started = time.monotonic()
+        self.busy_time = 0.0
+        self.active = 0
+        self.processed = 0
+
+    @contextmanager
+    def track(self, items=1):
+        """Учитывает время выполнения блока как занятость одного слота стадии."""
+        self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.busy_time += time.monotonic() - start
+            self.active -= 1
+            self.processed += items
+
+    def snapshot(self):
+        """Текущее состояние стадии. utilization - доля занятого времени всех слотов."""
+        elapsed = time.monotonic() - self.started
+        capacity = elapsed * self.concurrency
+        return {
+            "stage": self.name,
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "processed": self.processed,
+            "busy_seconds": round(self.busy_time, 3),
+            "utilization": round(self.busy_time / capacity, 4) if capacity > 0 else 0.0,
+        }
@@ -1,59 +1,512 @@
 import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from whisper_transcriber import WhisperTranscriber
-from audio_processor import AudioProcessor
+from audio_processor import AudioProcessor, preprocess_upload, SAMPLE_RATE
+from audio_preprocessing import parse_stage_overrides
+from inference_batcher import InferenceBatcher
+from stage_stats import StageStats
+from transcript_cache import TranscriptCache
+from speech_windows import SpeechWindow, stitch_transcripts
+from sharded_transcriber import ShardedTranscriber
+from task_scheduler import TaskScheduler, PRIORITIES
+from spectral_gate import profile_path
+from metrics import timed, STAGE_SECONDS, TASK_RTF, TASK_PEAK_MEMORY, TASKS
+
+# Ответ на задачу, которую не приняли из-за перегрузки
+OVERLOAD_ERROR = "Сервер перегружен, ожидание около {minutes} мин, попробуйте позже"
+
+# Оценка длительности записи по размеру, если ffprobe не смог прочитать заголовок (~128 кбит/с)
+FALLBACK_BYTES_PER_SECOND = 16000
+
+# Вес нового измерения в скользящем среднем RTF
+RTF_SMOOTHING = 0.2
 
 class TaskQueue:
-    def __init__(self, maxsize=10):
+    def __init__(self, maxsize=10, block_seconds=None, max_batch_size=4, max_batch_wait_ms=50,
+                 preprocess_workers=4, inference_queue_size=8, result_ttl=600,
+                 cache_dir=None, cache_max_bytes=512 * 1024 * 1024, vad_window_seconds=30,
+                 shard_workers=0, shard_seconds=300, model_name="openai/whisper-large-v3",
+                 language="russian", inference_backend="hf", max_wait_seconds=None, initial_rtf=0.5,
+                 noise_profile_dir=None, denoise_workers=1):
         """
         Асинхронная очередь задач для обработки аудиофайлов через WebSocket.
+
+        Обработка идёт двумя стадиями: preprocess_workers процессов декодируют и предобрабатывают
+        файлы, а готовое аудио через очередь размером inference_queue_size попадает к модели,
+        которая собирает батчи до max_batch_size записей с ожиданием не дольше max_batch_wait_ms.
+        Если задан block_seconds, файлы обрабатываются потоково блоками этой длины.
+        Результат, который никто не забрал за result_ttl секунд, удаляется.
+        Если задан cache_dir, расшифровки кэшируются на диске по хешу загрузки (не более cache_max_bytes).
+        Если задан vad_window_seconds, в модель попадают только участки речи, упакованные в окна этой длины.
+        Записи длиннее shard_seconds при shard_workers > 0 распознаются шардами в shard_workers процессах,
+        у каждого из которых своя модель.
+        model_name, language и inference_backend выбирают модель Whisper и движок инференса.
+
+        Очередь не FIFO: задачи идут по классам приоритета, клиенты делят обработку честно,
+        а среди задач клиента первыми идут короткие (см. TaskScheduler). Новая задача не принимается,
+        если очередь полна или оценка ожидания больше max_wait_seconds; оценка строится по
+        скользящему среднему RTF (время обработки / длительность записи), начиная с initial_rtf.
+
+        Если задан noise_profile_dir, профиль шума источника записи (noise_source в add_task)
+        сохраняется там и переиспользуется для следующих записей того же источника.
+        denoise_workers - число потоков подавления шума внутри одного процесса предобработки.
         """
-        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.queue = TaskScheduler(maxsize=maxsize)
+        self.workers = preprocess_workers
+        self.max_wait_seconds = max_wait_seconds
+        self.rtf = initial_rtf
+        # task_id -> (время начала обработки, длительность записи) для задач в работе
+        self.running = {}
+        # task_id -> время постановки в очередь и время стадий задачи (прикладывается к результату)
+        self.enqueued = {}
+        self.timings = {}
+        self.block_seconds = block_seconds
+        self.vad_window_seconds = vad_window_seconds
+        self.noise_profile_dir = noise_profile_dir
+        self.denoise_workers = denoise_workers
+        # task_id -> файл профиля шума источника записи
+        self.noise_profile_paths = {}
+        # task_id -> стадии предобработки, заданные в запросе, и итоговое решение о предобработке
+        self.stage_overrides = {}
+        self.preprocessing = {}
+
+        # Единственный экземпляр Whisper загружается в фоне (см. load_model), до этого
+        # задачи принимаются и предобрабатываются, а записи ждут модель в очереди батчера
+        self.model_name = model_name
+        self.language = language
+        self.inference_backend = inference_backend
+        self.transcriber = None
+        self.load_error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.batcher = InferenceBatcher(
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_batch_wait_ms,
+            max_pending=inference_queue_size,
+        )
+
+        # librosa и подавление шума упираются в GIL, поэтому предобработка идёт в отдельных процессах.
+        # spawn вместо fork: процесс уже держит модель и потоки torch
+        self.preprocess_pool = ProcessPoolExecutor(
+            max_workers=preprocess_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.preprocess_stats = StageStats("preprocess", concurrency=preprocess_workers)
 
-        # Создаем единственный экземпляр Whisper
-        self.transcriber = WhisperTranscriber()
+        # Пул процессов с собственными моделями для длинных записей
+        self.sharded = None
+        if shard_workers:
+            self.sharded = ShardedTranscriber(
+                model_name,
+                language,
+                backend=inference_backend,
+                workers=shard_workers,
+                shard_seconds=shard_seconds,
+                sr=SAMPLE_RATE,
+            )
 
-        # Храним результаты задач
+        # Храним future с результатом для каждой задачи
         self.results = {}
+        self.result_ttl = result_ttl
+
+        # Очереди событий (статус, частичный текст, результат) для задач, которые за ними следят
+        self.events = {}
+
+        # Кэш расшифровок и ключи кэша задач, которые сейчас в работе
+        self.cache = TranscriptCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.cache_keys = {}
+
+        # Фоновые задачи сборки результатов (храним ссылки, чтобы их не собрал GC)
+        self.background_tasks = set()
+
+        # Загружаем модель, не блокируя цикл событий
+        self.started_at = time.perf_counter()
+        self.load_task = asyncio.create_task(self.load_model(warmup_batch_size=max_batch_size))
 
         # Запускаем обработку очереди
-        self.processing_task = asyncio.create_task(self.process_tasks())
+        self.processing_tasks = [asyncio.create_task(self.process_tasks()) for _ in range(preprocess_workers)]
 
-    async def add_task(self, audio_bytes, task_id):
+    async def load_model(self, warmup_batch_size=1):
         """
-        Добавляет аудиопоток в очередь. Если очередь полна, возвращает None.
+        Загружает модель в отдельном потоке, прогревает её батчем warmup_batch_size
+        и передаёт батчеру. Время загрузки и прогрева сохраняется для readiness().
         """
-        if self.queue.full():
-            return False
+        try:
+            self.transcriber = await asyncio.to_thread(
+                WhisperTranscriber,
+                model_name=self.model_name,
+                language=self.language,
+                backend=self.inference_backend,
+            )
+            self.load_seconds = time.perf_counter() - self.started_at
+            self.warmup_seconds = await asyncio.to_thread(self.transcriber.warm_up, warmup_batch_size)
+        except Exception as e:
+            print(f"Ошибка загрузки модели: {e}")
+            self.load_error = str(e)
+            self.batcher.set_transcriber(None, error=self.load_error)
+            return
 
-        # Создаем пустой слот для результата
-        self.results[task_id] = None
+        self.batcher.set_transcriber(self.transcriber)
+        print(f"[INFO] Модель готова: загрузка {self.load_seconds:.1f} с, прогрев {self.warmup_seconds:.1f} с")
+
+    def readiness(self):
+        """Состояние модели: loading, ready или failed, и время до готовности (сек)."""
+        if self.load_error:
+            status = "failed"
+        elif self.batcher.ready.is_set():
+            status = "ready"
+        else:
+            status = "loading"
+        time_to_ready = None
+        if status == "ready":
+            time_to_ready = self.load_seconds + self.warmup_seconds
+        return {
+            "status": status,
+            "error": self.load_error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "time_to_ready": time_to_ready,
+        }
+
+    async def add_task(self, upload, task_id, stream_events=False, client_id="", priority="normal", noise_source=None,
+                       preprocessing=None):
+        """
+        Добавляет загрузку (UploadBuffer) в очередь клиента client_id с приоритетом priority.
+        Возвращает (оценка ожидания в секундах, error); error не None, если задача не принята.
+        С stream_events=True ход обработки можно читать через iter_events.
+        noise_source - источник записи (микрофон, канал), профиль шума которого переиспользуется.
+        preprocessing - стадии предобработки из запроса: "auto" (по умолчанию), "all", "none"
+        или словарь {стадия: true/false}, см. parse_stage_overrides.
+        """
+        if priority not in PRIORITIES:
+            return None, f"Неизвестный приоритет: {priority}. Доступны: {', '.join(PRIORITIES)}"
+        stage_overrides, error = parse_stage_overrides(preprocessing)
+        if error:
+            return None, error
+
+        # Повторная загрузка того же файла отдаётся из кэша без очереди
+        if not self.noise_profile_dir:
+            noise_source = None
+        cache_key = self.cache_key(upload, noise_source, stage_overrides)
+        cached = self.cache.get(cache_key) if cache_key else None
+
+        if cached is None:
+            wait_estimate = self.estimate_wait(priority)
+            if self.queue.full() or (self.max_wait_seconds and wait_estimate > self.max_wait_seconds):
+                TASKS.inc(status="rejected")
+                return wait_estimate, OVERLOAD_ERROR.format(minutes=max(1, round(wait_estimate / 60)))
+            duration = await self.estimate_duration(upload)
+        else:
+            wait_estimate = 0.0
+
+        # Создаем future, который завершится вместе с задачей
+        self.results[task_id] = asyncio.get_running_loop().create_future()
+        if stream_events:
+            self.events[task_id] = asyncio.Queue()
+
+        if cached is not None:
+            upload.close()
+            if cached.get("preprocessing") is not None:
+                self.preprocessing[task_id] = cached["preprocessing"]
+            self.set_result(task_id, cached["transcript"], None, cached.get("segments"))
+            return wait_estimate, None
+        if cache_key:
+            self.cache_keys[task_id] = cache_key
 
         # Ставим в очередь
-        await self.queue.put((task_id, audio_bytes))
+        self.enqueued[task_id] = time.perf_counter()
+        if noise_source:
+            self.noise_profile_paths[task_id] = profile_path(self.noise_profile_dir, str(noise_source))
+        if stage_overrides:
+            self.stage_overrides[task_id] = stage_overrides
+        try:
+            await self.queue.put((task_id, upload, duration), client_id=client_id, priority=priority, cost=duration)
+        except asyncio.QueueFull:
+            # Очередь заполнилась, пока определялась длительность
+            self.results.pop(task_id)
+            self.events.pop(task_id, None)
+            self.cache_keys.pop(task_id, None)
+            self.enqueued.pop(task_id, None)
+            self.noise_profile_paths.pop(task_id, None)
+            self.stage_overrides.pop(task_id, None)
+            TASKS.inc(status="rejected")
+            return wait_estimate, OVERLOAD_ERROR.format(minutes=max(1, round(wait_estimate / 60)))
+
+        return wait_estimate, None
+
+    async def estimate_duration(self, upload):
+        """Длительность записи (сек) по заголовку файла, а если его не прочитать - по размеру."""
+        duration, _ = await asyncio.to_thread(AudioProcessor(upload).probe_duration)
+        if duration is None:
+            duration = upload.size / FALLBACK_BYTES_PER_SECOND
+        return duration
+
+    def estimate_wait(self, priority="normal"):
+        """
+        Грубая оценка ожидания (сек) новой задачи класса priority: работа, стоящая в очереди
+        не позже неё, плюс остаток задач в работе, делённые на число параллельных обработчиков.
+        """
+        now = time.perf_counter()
+        remaining = sum(max(0.0, duration * self.rtf - (now - started)) for started, duration in self.running.values())
+        return (self.queue.cost_ahead(priority) * self.rtf + remaining) / self.workers
+
+    def cache_key(self, upload, noise_source=None, stage_overrides=None):
+        """Ключ кэша для загрузки или None, если кэш выключен."""
+        if self.cache is None or upload.content_hash is None:
+            return None
+        return TranscriptCache.make_key(
+            upload.content_hash,
+            model=self.model_name,
+            language=self.language,
+            backend=self.inference_backend,
+            sample_rate=SAMPLE_RATE,
+            block_seconds=self.block_seconds,
+            vad_window_seconds=self.vad_window_seconds,
+            noise_source=noise_source,
+            stage_overrides=stage_overrides or None,
+        )
+
+    def set_result(self, task_id, transcript, error, segments=None):
+        """
+        Завершает future задачи её результатом. segments - фрагменты текста с метками времени.
+        """
+        started, duration = self.running.pop(task_id, (None, 0))
+        if transcript is not None and duration > 0:
+            rtf = (time.perf_counter() - started) / duration
+            self.rtf = (1 - RTF_SMOOTHING) * self.rtf + RTF_SMOOTHING * rtf
+
+        timings = self.finish_timings(task_id, started)
+        if transcript is None:
+            TASKS.inc(status="error")
+        else:
+            # Задача, которая не проходила обработку, отдана из кэша
+            TASKS.inc(status="ok" if started is not None else "cached")
+
+        preprocessing = self.preprocessing.pop(task_id, None)
+        cache_key = self.cache_keys.pop(task_id, None)
+        if cache_key and transcript is not None:
+            self.cache.put(cache_key, {"transcript": transcript, "segments": segments, "preprocessing": preprocessing})
 
-        return True
+        future = self.results.get(task_id)
+        if future is None or future.done():
+            return
+
+        if transcript is None:
+            result = {"type": "result", "task_id": task_id, "error": error}
+        else:
+            result = {"type": "result", "task_id": task_id, "transcript": transcript}
+            if segments is not None:
+                result["segments"] = segments
+        if preprocessing is not None:
+            result["preprocessing"] = preprocessing
+        if timings:
+            result["timings"] = timings
+        future.set_result(result)
+        self.publish(task_id, result)
+
+        # Если клиент пропал и результат никто не заберёт, запись не должна висеть вечно
+        asyncio.get_running_loop().call_later(self.result_ttl, self.discard_result, task_id, future)
+
+    def add_timings(self, task_id, timings):
+        """Добавляет время стадий задачи и отправляет его в гистограммы метрик."""
+        task_timings = self.timings.setdefault(task_id, {})
+        for name, value in timings.items():
+            task_timings[name] = task_timings.get(name, 0) + value
+            if name == "peak_memory_bytes":
+                TASK_PEAK_MEMORY.observe(value)
+            elif name != "audio_seconds":
+                STAGE_SECONDS.observe(value, stage=name)
+
+    def finish_timings(self, task_id, started):
+        """
+        Итоговое время задачи: стадии, общее время от начала обработки (total)
+        и RTF - общее время, делённое на длительность записи.
+        """
+        timings = self.timings.pop(task_id, {})
+        self.enqueued.pop(task_id, None)
+        if started is None:
+            return timings
+
+        timings["total"] = time.perf_counter() - started
+        STAGE_SECONDS.observe(timings["total"], stage="total")
+        if timings.get("audio_seconds"):
+            timings["rtf"] = timings["total"] / timings["audio_seconds"]
+            TASK_RTF.observe(timings["rtf"])
+        return {name: round(value, 4) if isinstance(value, float) else value for name, value in timings.items()}
+
+    def discard_result(self, task_id, future):
+        """Удаляет невостребованный результат задачи."""
+        if self.results.get(task_id) is future:
+            del self.results[task_id]
+
+    async def wait_result(self, task_id):
+        """
+        Ждёт завершения задачи и возвращает её результат. Запись о задаче после этого удаляется.
+        """
+        future = self.results[task_id]
+        try:
+            # shield: отмена ожидающего не должна отменять саму задачу
+            return await asyncio.shield(future)
+        finally:
+            self.discard_result(task_id, future)
+
+    def publish(self, task_id, event):
+        """Отправляет событие задачи подписчику, если он есть."""
+        events = self.events.get(task_id)
+        if events is not None:
+            events.put_nowait(event)
+
+    def publish_status(self, task_id, status):
+        self.publish(task_id, {"type": "status", "task_id": task_id, "status": status})
+
+    async def iter_events(self, task_id):
+        """
+        Асинхронно отдаёт события задачи до итогового результата включительно.
+        Если подписчик ушёл, не дочитав результат, он остаётся доступен через wait_result
+        до истечения result_ttl.
+        """
+        events = self.events[task_id]
+        future = self.results[task_id]
+        try:
+            while True:
+                event = await events.get()
+                yield event
+                if event["type"] == "result":
+                    break
+        finally:
+            self.events.pop(task_id, None)
+        self.discard_result(task_id, future)
 
     async def process_tasks(self):
         """
-        Асинхронная обработка задач: предобработка → инференс Whisper.
+        Стадия предобработки: берёт задачу, предобрабатывает её в пуле процессов
+        и передаёт аудио на стадию инференса, не дожидаясь распознавания.
         """
         while True:
-            task_id, audio_bytes = await self.queue.get()
+            task_id, upload, duration = await self.queue.get()
+            self.running[task_id] = (time.perf_counter(), duration)
+            self.add_timings(task_id, {"queue_wait": time.perf_counter() - self.enqueued.pop(task_id, time.perf_counter())})
+            noise_profile_path = self.noise_profile_paths.pop(task_id, None)
+            stage_overrides = self.stage_overrides.pop(task_id, None)
             try:
-                processor = AudioProcessor(audio_bytes)
-                preprocessed_audio, error = await asyncio.to_thread(processor.process)
-
-                if preprocessed_audio is None:
-                    self.results[task_id] = {"task_id": task_id, "error": error}
+                self.publish_status(task_id, "preprocessing")
+                if self.block_seconds:
+                    # Потоковый режим: блоки предобрабатываются и распознаются по очереди
+                    processor = AudioProcessor(upload, noise_profile_path, self.denoise_workers, stage_overrides)
+                    await self.transcribe_blocks(task_id, processor)
                 else:
-                    transcript, error = await asyncio.to_thread(self.transcriber.transcribe_audio, preprocessed_audio)
-                    if transcript is None:
-                        self.results[task_id] = {"task_id": task_id, "error": error}
-                    else:
-                        self.results[task_id] = {"task_id": task_id, "transcript": transcript}
+                    await self.preprocess_and_submit(task_id, upload, noise_profile_path, stage_overrides)
 
             except Exception as e:
-                self.results[task_id] = {"task_id": task_id, "error": str(e)}
+                self.set_result(task_id, None, str(e))
             finally:
-                self.queue.task_done()
+                upload.close()
+
+    async def preprocess_and_submit(self, task_id, upload, noise_profile_path=None, stage_overrides=None):
+        """Предобрабатывает файл в пуле процессов и ставит окна речи в очередь инференса."""
+        timings = {}
+        preprocess = functools.partial(
+            preprocess_upload, upload, self.vad_window_seconds, noise_profile_path, self.denoise_workers,
+            stage_overrides, self.sharded.shard_seconds if self.sharded is not None else None,
+        )
+        with self.preprocess_stats.track(), timed(timings, "preprocess"):
+            windows, worker_timings, preprocessing, error = await asyncio.get_running_loop().run_in_executor(
+                self.preprocess_pool, preprocess
+            )
+        self.add_timings(task_id, {**worker_timings, **timings})
+        if preprocessing is not None:
+            self.preprocessing[task_id] = preprocessing
+
+        if windows is None:
+            self.set_result(task_id, None, error)
+            return
+
+        # Длинная запись уходит в пул шардов и не занимает основную модель
+        if self.sharded is not None and self.sharded.is_long(windows):
+            self.publish_status(task_id, "transcribing")
+            self.run_in_background(self.collect_shards(task_id, windows))
+            return
+
+        # Ждём только места в очереди инференса, результат соберётся в фоне по готовности окон
+        futures = [await self.batcher.submit(window.audio) for window in windows]
+        self.publish_status(task_id, "transcribing")
+        self.run_in_background(self.collect_windows(task_id, windows, futures))
+
+    def run_in_background(self, coro):
+        """Запускает фоновую задачу и держит ссылку на неё до завершения."""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def collect_shards(self, task_id, windows):
+        """Распознает запись шардами в пуле процессов и сохраняет склеенный результат."""
+        timings = {}
+        try:
+            with timed(timings, "transcription"):
+                transcript, segments, error = await self.sharded.transcribe(windows)
+            self.add_timings(task_id, timings)
+            self.set_result(task_id, transcript, error, segments)
+        except Exception as e:
+            self.set_result(task_id, None, str(e))
+
+    async def collect_windows(self, task_id, windows, futures):
+        """Ждёт распознавания всех окон задачи и склеивает их в итоговый результат."""
+        timings = {}
+        try:
+            with timed(timings, "transcription"):
+                outputs = await asyncio.gather(*futures)
+            self.add_timings(task_id, timings)
+            transcript, segments, error = stitch_transcripts(windows, outputs)
+            self.set_result(task_id, transcript, error, segments)
+        except Exception as e:
+            self.set_result(task_id, None, str(e))
+
+    async def transcribe_blocks(self, task_id, processor):
+        """
+        Распознает блоки AudioProcessor по мере их предобработки. Блоки разных задач попадают
+        в общие батчи, текст каждого блока публикуется как частичный результат.
+        """
+        blocks = processor.process_stream(self.block_seconds)
+        windows, outputs = [], []
+        offset = 0
+        timings = {}
+        try:
+            while True:
+                with self.preprocess_stats.track(), timed(timings, "preprocess"):
+                    block = await asyncio.to_thread(next, blocks, None)
+                if block is None:
+                    break
+
+                # Метки времени блока сдвигаются на его начало в исходной записи; аудио для склейки
+                # не нужно и не хранится, иначе память снова росла бы с длиной записи
+                windows.append(SpeechWindow(None, [(0, offset, block.size)], SAMPLE_RATE))
+                offset += block.size
+
+                with timed(timings, "transcription"):
+                    output, error = await self.batcher.transcribe(block)
+                outputs.append((output, error))
+                if output is None:
+                    break
+                if output["text"].strip():
+                    self.publish(task_id, {"type": "partial", "task_id": task_id, "text": output["text"].strip()})
+        finally:
+            blocks.close()
+
+        self.add_timings(task_id, {**timings, "audio_seconds": offset / SAMPLE_RATE})
+        if processor.preprocessing is not None:
+            self.preprocessing[task_id] = processor.preprocessing
+        transcript, segments, error = stitch_transcripts(windows, outputs)
+        self.set_result(task_id, transcript, error, segments)
+
+    def stage_stats(self):
+        """Загрузка стадий конвейера и заполненность очередей."""
+        return {
+            "queue": {"size": self.queue.qsize(), "maxsize": self.queue.maxsize, "wait_estimate": self.estimate_wait()},
+            "rtf": self.rtf,
+            "inference_queue": {"size": self.batcher.pending.qsize(), "maxsize": self.batcher.pending.maxsize},
+            "stages": [self.preprocess_stats.snapshot(), self.batcher.stats.snapshot()],
+        }
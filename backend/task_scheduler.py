@@ -0,0 +1,88 @@
+import asyncio
+import heapq
+import itertools
+
+# Классы приоритета: задачи более высокого класса всегда берутся раньше
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# Минимальная «стоимость» задачи (сек) при честном разделении, чтобы задачи неизвестной
+# или нулевой длительности тоже продвигали очередь клиента
+MIN_COST = 1.0
+
+
+class TaskScheduler:
+    def __init__(self, maxsize=10):
+        """
+        Очередь задач с приоритетами и честным разделением между клиентами.
+
+        Внутри класса приоритета у каждого клиента своя очередь, упорядоченная по cost
+        (оценке длительности записи) - сначала короткие. Между клиентами работает
+        честная очередь с виртуальным временем: клиент, уже получивший много секунд
+        обработки, уступает тем, кто получил меньше, поэтому пачка длинных файлов
+        одного клиента не задерживает короткие файлы остальных.
+        """
+        self.maxsize = maxsize
+        self.size = 0
+        self.counter = itertools.count()
+        self.not_empty = asyncio.Condition()
+
+        # Для каждого класса: client_id -> куча (cost, номер, item)
+        self.clients = [{} for _ in PRIORITIES]
+        # Для каждого класса: виртуальное время и отметки окончания обслуживания клиентов
+        self.virtual_time = [0.0] * len(PRIORITIES)
+        self.finish_tags = [{} for _ in PRIORITIES]
+        # Суммарная длительность (cost) ожидающих задач по классам
+        self.queued_cost = [0.0] * len(PRIORITIES)
+
+    def qsize(self):
+        return self.size
+
+    def full(self):
+        return self.maxsize > 0 and self.size >= self.maxsize
+
+    def cost_ahead(self, priority="normal"):
+        """Суммарная длительность задач, которые будут взяты не позже новой задачи класса priority."""
+        return sum(self.queued_cost[:PRIORITIES[priority] + 1])
+
+    async def put(self, item, client_id="", priority="normal", cost=0.0):
+        """Ставит задачу в очередь. Если очередь заполнена, бросает asyncio.QueueFull."""
+        if self.full():
+            raise asyncio.QueueFull
+        level = PRIORITIES[priority]
+        heapq.heappush(self.clients[level].setdefault(client_id, []), (cost, next(self.counter), item))
+        self.queued_cost[level] += cost
+        self.size += 1
+        async with self.not_empty:
+            self.not_empty.notify()
+
+    async def get(self):
+        """Ждёт и возвращает следующую задачу."""
+        async with self.not_empty:
+            await self.not_empty.wait_for(self.qsize)
+            return self.pop()
+
+    def pop(self):
+        level = next(level for level, clients in enumerate(self.clients) if clients)
+        clients = self.clients[level]
+        finish_tags = self.finish_tags[level]
+        virtual_time = self.virtual_time[level]
+
+        # Берём клиента, у которого самая короткая задача закончится раньше всех по виртуальному времени
+        def finish(client_id):
+            return max(virtual_time, finish_tags.get(client_id, 0.0)) + max(clients[client_id][0][0], MIN_COST)
+
+        client_id = min(clients, key=finish)
+        start = max(virtual_time, finish_tags.get(client_id, 0.0))
+        cost, _, item = heapq.heappop(clients[client_id])
+        finish_tags[client_id] = start + max(cost, MIN_COST)
+        if not clients[client_id]:
+            del clients[client_id]
+
+        self.virtual_time[level] = start
+        # Отметки клиентов, которые уже не опережают виртуальное время, больше не нужны
+        for stale in [key for key, tag in finish_tags.items() if tag <= start and key not in clients]:
+            del finish_tags[stale]
+
+        self.queued_cost[level] -= cost
+        self.size -= 1
+        return item
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+class TranscriptCache:
+    def __init__(self, directory="transcript_cache", max_bytes=512 * 1024 * 1024):
+        """
+        Кэш расшифровок на диске, адресуемый по содержимому загрузки и параметрам обработки.
+        Суммарный размер ограничен max_bytes, при переполнении удаляются давно не запрошенные записи.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # key -> размер файла, порядок - от давно использованных к недавним
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        files = [entry for entry in os.scandir(directory) if entry.name.endswith(".json")]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            self.entries[entry.name[:-len(".json")]] = entry.stat().st_size
+            self.total_bytes += entry.stat().st_size
+        self.evict()
+
+    @staticmethod
+    def make_key(content_hash, **params):
+        """Ключ кэша: хеш загрузки плюс всё, что влияет на результат распознавания."""
+        payload = json.dumps({"content": content_hash, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Возвращает сохранённую запись (словарь с расшифровкой) или None."""
+        if key not in self.entries:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._remove(key)
+            return None
+
+        # Время изменения файла хранит порядок LRU между перезапусками
+        self.entries.move_to_end(key)
+        os.utime(self._path(key))
+        return entry
+
+    def put(self, key, entry):
+        """Сохраняет запись (JSON-совместимый словарь) и при необходимости вытесняет старые."""
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        self.total_bytes -= self.entries.pop(key, 0)
+        self.entries[key] = os.path.getsize(path)
+        self.total_bytes += self.entries[key]
+        self.evict()
+
+    def evict(self):
+        """Удаляет самые давно использованные записи, пока кэш больше max_bytes."""
+        while self.total_bytes > self.max_bytes and self.entries:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        self.total_bytes -= self.entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
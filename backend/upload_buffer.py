@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+import time
+
+# Размер загрузки, после которого данные сбрасываются во временный файл
+DEFAULT_MEMORY_THRESHOLD = 32 * 1024 * 1024
+
+
+class UploadBuffer:
+    def __init__(self, memory_threshold=DEFAULT_MEMORY_THRESHOLD, tmp_dir=None):
+        """
+        Буфер для приёма загрузки по частям.
+        Пока размер меньше memory_threshold, данные лежат в bytearray,
+        затем переносятся во временный файл на диске.
+        Хеш содержимого считается по мере поступления пакетов.
+        """
+        self.memory_threshold = memory_threshold
+        self.tmp_dir = tmp_dir
+        self.size = 0
+        self._memory = bytearray()
+        self._file = None
+        self.path = None
+        self._hash = hashlib.blake2b(digest_size=32)
+        self.content_hash = None
+
+    @property
+    def in_memory(self):
+        """True, если данные ещё не сброшены на диск."""
+        return self._file is None and self.path is None
+
+    def write(self, data):
+        """Дописывает очередной пакет данных в конец буфера."""
+        self._hash.update(data)
+        if self._file is None and self.path is None:
+            if self.size + len(data) <= self.memory_threshold:
+                self._memory += data
+                self.size += len(data)
+                return
+            self._spill_to_disk()
+
+        self._file.write(data)
+        self.size += len(data)
+
+    def _spill_to_disk(self):
+        """Переносит накопленные данные из памяти во временный файл."""
+        fd, self.path = tempfile.mkstemp(prefix="upload_", dir=self.tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(self._memory)
+        self._memory = bytearray()
+
+    def finish(self):
+        """Завершает приём данных. После вызова буфер доступен только для чтения."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._hash is not None:
+            self.content_hash = self._hash.hexdigest()
+            self._hash = None
+
+    def getbuffer(self):
+        """Возвращает данные из памяти без копирования (только для in_memory)."""
+        if not self.in_memory:
+            raise ValueError("Данные загрузки находятся на диске, используйте path")
+        return memoryview(self._memory)
+
+    def read(self):
+        """Читает всю загрузку целиком (для случаев, когда нужен bytes)."""
+        if self.in_memory:
+            return bytes(self._memory)
+        self.finish()
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        """Освобождает память и удаляет временный файл."""
+        self.finish()
+        self._memory = bytearray()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class PendingUploads:
+    def __init__(self, ttl=600, memory_threshold=DEFAULT_MEMORY_THRESHOLD):
+        """
+        Незавершённые загрузки, которые можно продолжить после обрыва соединения.
+        Загрузка, к которой не переподключались ttl секунд, удаляется.
+        """
+        self.ttl = ttl
+        self.memory_threshold = memory_threshold
+        # upload_id -> [UploadBuffer, владелец (соединение), время отключения или None]
+        self.uploads = {}
+
+    def attach(self, upload_id, owner):
+        """
+        Возвращает загрузку upload_id (новую или прерванную) и закрепляет её за соединением owner.
+        Если старое соединение ещё не заметило обрыв, загрузку забирает новое.
+        """
+        self.expire()
+        entry = self.uploads.get(upload_id)
+        if entry is None:
+            entry = self.uploads[upload_id] = [UploadBuffer(memory_threshold=self.memory_threshold), None, None]
+        entry[1] = owner
+        entry[2] = None
+        return entry[0]
+
+    def owns(self, upload_id, owner):
+        entry = self.uploads.get(upload_id)
+        return entry is not None and entry[1] is owner
+
+    def detach(self, upload_id, owner):
+        """Соединение оборвалось: загрузка ждёт переподключения ttl секунд."""
+        self.expire()
+        if self.owns(upload_id, owner):
+            self.uploads[upload_id][1] = None
+            self.uploads[upload_id][2] = time.monotonic()
+
+    def complete(self, upload_id, owner):
+        """Загрузка завершена, дальше ей распоряжается вызывающий. Возвращает буфер или None."""
+        if not self.owns(upload_id, owner):
+            return None
+        return self.uploads.pop(upload_id)[0]
+
+    def expire(self):
+        """Удаляет загрузки, брошенные дольше ttl секунд назад."""
+        now = time.monotonic()
+        for upload_id, (upload, _, detached_at) in list(self.uploads.items()):
+            if detached_at is not None and now - detached_at > self.ttl:
+                upload.close()
+                del self.uploads[upload_id]
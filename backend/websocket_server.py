@@ -1,68 +1,316 @@
-import json
 import asyncio
-import websockets
+import struct
+from contextlib import aclosing
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from task_queue import TaskQueue
+from upload_buffer import UploadBuffer, PendingUploads, DEFAULT_MEMORY_THRESHOLD
+from result_delivery import ResultDelivery
+from live_transcriber import LiveTranscriber, create_decoder, SAMPLE_RATE
+from metrics import REGISTRY, QUEUE_SIZE, QUEUE_WAIT_ESTIMATE, STAGE_UTILIZATION, MODEL_READY, DELIVERY_PENDING
 
 app = FastAPI()
 
 task_queue = None  # Пока не создаем TaskQueue
+result_delivery = None
+pending_uploads = None
+
+# Клиентский сервер, на который отправляются результаты
+CLIENT_URI = "ws://localhost:9000/client-endpoint"
+
+# Сколько недоставленных результатов держать на точку и максимальная пауза между переподключениями (сек)
+DELIVERY_MAX_BUFFER = 1000
+DELIVERY_MAX_BACKOFF = 30
+
+# Модель Whisper (имя на HuggingFace или локальный снимок из inference_backends.save_snapshot),
+# язык и движок инференса ("hf", "hf-int8" для CPU, "ctranslate2")
+WHISPER_MODEL = "openai/whisper-large-v3"
+WHISPER_LANGUAGE = "russian"
+INFERENCE_BACKEND = "hf"
+
+# Загрузки больше этого размера принимаются во временный файл
+UPLOAD_MEMORY_THRESHOLD = DEFAULT_MEMORY_THRESHOLD
+
+# Сколько секунд прерванная загрузка ждёт переподключения клиента
+UPLOAD_RESUME_TTL = 600
+
+# Длина заголовка фрейма докачиваемой загрузки: смещение данных в файле (uint64, big-endian)
+FRAME_HEADER = struct.Struct(">Q")
+
+# Длина блока (сек) для потоковой предобработки длинных записей, None - обработка целиком
+PREPROCESS_BLOCK_SECONDS = None
+
+# Батчи распознавания: размер и ожидание добора (мс)
+MAX_BATCH_SIZE = 4
+MAX_BATCH_WAIT_MS = 50
+
+# Конвейер: число процессов предобработки и размер очереди перед моделью
+PREPROCESS_WORKERS = 4
+INFERENCE_QUEUE_SIZE = 8
+
+# Длина окна (сек), в которые упаковываются участки речи; None - распознавать запись целиком
+VAD_WINDOW_SECONDS = 30
+
+# Допустимая оценка ожидания в очереди (сек), дольше - задача не принимается; None - без ограничения
+MAX_WAIT_SECONDS = 30 * 60
+
+# Шардирование длинных записей: число процессов со своей моделью (0 - выключено) и длина шарда (сек)
+SHARD_WORKERS = 0
+SHARD_SECONDS = 300
+
+# Живой поток: как часто распознавать окно заново и его максимальная длина (сек)
+LIVE_STEP_SECONDS = 2.0
+LIVE_MAX_BUFFER_SECONDS = 25.0
+
+# Кэш расшифровок повторно загруженных файлов (None - без кэша) и его размер на диске
+TRANSCRIPT_CACHE_DIR = "transcript_cache"
+TRANSCRIPT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Профили шума источников записей ("noise_source" в первом сообщении, None - не сохранять)
+# и число потоков подавления шума в каждом процессе предобработки
+NOISE_PROFILE_DIR = "noise_profiles"
+DENOISE_WORKERS = 1
 
 @app.on_event("startup")
 async def startup_event():
-    """Создает TaskQueue после старта FastAPI."""
-    global task_queue
-    task_queue = TaskQueue()
+    """Создает TaskQueue и доставку результатов после старта FastAPI."""
+    global task_queue, result_delivery, pending_uploads
+    result_delivery = ResultDelivery(max_buffer=DELIVERY_MAX_BUFFER, max_backoff=DELIVERY_MAX_BACKOFF)
+    pending_uploads = PendingUploads(ttl=UPLOAD_RESUME_TTL, memory_threshold=UPLOAD_MEMORY_THRESHOLD)
+    task_queue = TaskQueue(
+        block_seconds=PREPROCESS_BLOCK_SECONDS,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_batch_wait_ms=MAX_BATCH_WAIT_MS,
+        preprocess_workers=PREPROCESS_WORKERS,
+        inference_queue_size=INFERENCE_QUEUE_SIZE,
+        cache_dir=TRANSCRIPT_CACHE_DIR,
+        cache_max_bytes=TRANSCRIPT_CACHE_MAX_BYTES,
+        vad_window_seconds=VAD_WINDOW_SECONDS,
+        shard_workers=SHARD_WORKERS,
+        shard_seconds=SHARD_SECONDS,
+        model_name=WHISPER_MODEL,
+        language=WHISPER_LANGUAGE,
+        inference_backend=INFERENCE_BACKEND,
+        max_wait_seconds=MAX_WAIT_SECONDS,
+        noise_profile_dir=NOISE_PROFILE_DIR,
+        denoise_workers=DENOISE_WORKERS,
+    )
 
-async def send_result_to_client(client_uri, task_id, overload_queue=False):
+@app.get("/ready")
+async def ready():
     """
-    Соединяется с клиентским сервером, отправляет результат и закрывает соединение.
+    Готовность к распознаванию: 200, когда модель загружена и прогрета, иначе 503.
+    Загрузки принимаются и до готовности, они ждут модель в очереди.
     """
-    # Отправляем сообщение клиенту, если сервер перегружен
-    if overload_queue:
-        result = {"task_id" : task_id, "error" : 'Сервер перегружен, попробуйте позже'}
-        async with websockets.connect(client_uri) as websocket:
-            await websocket.send(json.dumps(result))
+    state = task_queue.readiness()
+    return JSONResponse(state, status_code=200 if state["status"] == "ready" else 503)
+
+@app.get("/stats")
+async def stats():
+    """Загрузка стадий конвейера обработки и очереди доставки результатов."""
+    return {**task_queue.stage_stats(), "delivery_pending": result_delivery.pending()}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Метрики в текстовом формате Prometheus: гистограммы времени стадий, RTF и пика памяти задач,
+    счётчики задач; заполненность очередей и загрузка стадий снимаются в момент запроса.
+    """
+    stats = task_queue.stage_stats()
+    QUEUE_SIZE.set(stats["queue"]["size"], queue="tasks")
+    QUEUE_SIZE.set(stats["inference_queue"]["size"], queue="inference")
+    QUEUE_WAIT_ESTIMATE.set(stats["queue"]["wait_estimate"])
+    for stage in stats["stages"]:
+        STAGE_UTILIZATION.set(stage["utilization"], stage=stage["stage"])
+    MODEL_READY.set(1 if task_queue.readiness()["status"] == "ready" else 0)
+    for endpoint, pending in result_delivery.pending().items():
+        DELIVERY_PENDING.set(pending, endpoint=endpoint)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+async def send_result_to_client(client_uri, task_id, rejection=None):
+    """
+    Ждёт результат задачи и передаёт его в постоянное соединение с клиентским сервером.
+    rejection - готовый ответ, если задача не принята в очередь.
+    """
+    # Отправляем сообщение клиенту, если задача не принята
+    if rejection:
+        result = rejection
 
     else:
-        # Ждём, пока задача завершится
-        while task_queue.results.get(task_id) is None:
-            await asyncio.sleep(0.5)
+        # Ждём, пока задача завершится, и получаем результат
+        result = await task_queue.wait_result(task_id)
 
-        # Получаем результат
-        result = task_queue.results.pop(task_id)
+    result_delivery.send(client_uri, result)
 
-        # Подключаемся к клиентскому серверу и отправляем результат
-        async with websockets.connect(client_uri) as websocket:
-            await websocket.send(json.dumps(result))
+def rejection_result(task_id, wait_estimate, error):
+    """Ответ на непринятую задачу: ошибка и через сколько секунд имеет смысл повторить."""
+    result = {"type": "result", "task_id": task_id, "error": error}
+    if wait_estimate is not None:
+        result["retry_after"] = round(wait_estimate)
+    return result
 
+async def stream_events_to_socket(websocket, task_id):
+    """
+    Отправляет статусы, частичный и итоговый результат задачи в соединение загрузки.
+    Если соединение оборвалось раньше, результат доставляется через клиентский сервер.
+    """
+    try:
+        async with aclosing(task_queue.iter_events(task_id)) as events:
+            async for event in events:
+                await websocket.send_json(event)
+    except Exception as e:
+        print(f"Соединение задачи {task_id} прервано ({e}), результат будет отправлен клиентскому серверу")
+        asyncio.create_task(send_result_to_client(CLIENT_URI, task_id))
+        return
+    await websocket.close()
 
+async def live_session(websocket, task_id, first_message):
+    """
+    Живой поток: фреймы звука (format - pcm_f32le, pcm_s16le или сжатый поток вроде Ogg/Opus)
+    распознаются по мере поступления, в соединение уходят события segment и partial,
+    после END - итоговый result.
+    """
+    transcriber = LiveTranscriber(
+        task_queue.batcher.transcribe,
+        step_seconds=LIVE_STEP_SECONDS,
+        max_buffer_seconds=LIVE_MAX_BUFFER_SECONDS,
+    )
+    decoder = create_decoder(
+        transcriber.feed,
+        first_message.get("format", "pcm_f32le"),
+        first_message.get("sample_rate", SAMPLE_RATE),
+    )
+
+    async def receive_audio():
+        finished = False
+        try:
+            while (data := await websocket.receive_bytes()) != b"END":
+                await decoder.write(data)
+            await decoder.close()
+            finished = True
+        finally:
+            # Обрыв соединения или отмена: процесс декодера не должен пережить сессию
+            if not finished:
+                await decoder.abort()
+            transcriber.finish()
+
+    receiving = asyncio.create_task(receive_audio())
+    try:
+        async with aclosing(transcriber.iter_events(task_id)) as events:
+            async for event in events:
+                await websocket.send_json(event)
+    finally:
+        receiving.cancel()
+        try:
+            await receiving
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Ошибка приёма живого потока {task_id}: {e!r}")
+    await websocket.close()
+
+async def receive_frame(websocket, upload_id, upload, data):
+    """
+    Дописывает фрейм докачиваемой загрузки и подтверждает полученное смещение.
+    Возвращает False, если соединение нужно закрыть.
+    """
+    # Загрузку забрало более новое соединение того же клиента
+    if not pending_uploads.owns(upload_id, websocket):
+        return False
+
+    (offset,) = FRAME_HEADER.unpack_from(data)
+    if offset != upload.size:
+        await websocket.send_json({"type": "error", "error": f"Ожидалось смещение {upload.size}, получено {offset}"})
+        await websocket.close()
+        return False
+
+    upload.write(memoryview(data)[FRAME_HEADER.size:])
+    await websocket.send_json({"type": "ack", "offset": upload.size})
+    return True
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket-сервер для транскрибации аудио. Принимает данные и запускает обработку"""
+    """
+    WebSocket-сервер для транскрибации аудио. Принимает данные и запускает обработку.
+
+    Если в первом сообщении есть upload_id, загрузку можно докачать после обрыва:
+    сервер сразу отвечает {"type": "ack", "offset": N} - сколько байт уже получено,
+    каждый фрейм начинается с FRAME_HEADER (смещение данных в файле) и подтверждается ack.
+    Без upload_id фреймы - просто данные файла подряд.
+    С "mode": "live" соединение работает как живой поток (см. live_session).
+    """
     await websocket.accept()
-    audio_data = b""
+    upload = None
+    upload_id = None
+    task_added = False
+    received = False
 
     try:
         first_message = await websocket.receive_json()
         task_id = first_message.get("task_id")
+
+        # reply="socket": результат возвращается в это же соединение, без клиентского сервера
+        reply_on_socket = first_message.get("reply") == "socket"
+
+        # Очередь делится честно между клиентами; без client_id клиент - адрес соединения
+        client_id = first_message.get("client_id") or (websocket.client.host if websocket.client else "")
+        priority = first_message.get("priority", "normal")
+
+        # Записи одного источника (микрофон, канал) используют общий профиль шума
+        noise_source = first_message.get("noise_source")
+        # Стадии предобработки: по анализу записи ("auto") или заданные клиентом
+        preprocessing = first_message.get("preprocessing")
+
+        # mode="live": распознавание потока по мере поступления звука
+        if first_message.get("mode") == "live":
+            await live_session(websocket, task_id, first_message)
+            return
+
+        upload_id = first_message.get("upload_id")
+        if upload_id:
+            upload = pending_uploads.attach(upload_id, websocket)
+            await websocket.send_json({"type": "ack", "offset": upload.size})
+        else:
+            upload = UploadBuffer(memory_threshold=UPLOAD_MEMORY_THRESHOLD)
+
         while True:
             data = await websocket.receive_bytes()
             if data == b"END":
-                task_added = await task_queue.add_task(audio_data, task_id)
+                if upload_id and pending_uploads.complete(upload_id, websocket) is None:
+                    # Загрузку уже забрало более новое соединение того же клиента
+                    return
+                received = True
+                upload.finish()
+                wait_estimate, error = await task_queue.add_task(
+                    upload, task_id, stream_events=reply_on_socket, client_id=client_id, priority=priority,
+                    noise_source=noise_source, preprocessing=preprocessing,
+                )
+                task_added = error is None
                 if not task_added:
-                    client_uri = "ws://localhost:9000/client-endpoint"
-                    asyncio.create_task(send_result_to_client(client_uri, task_id, overload_queue=True))
+                    rejection = rejection_result(task_id, wait_estimate, error)
+                    if reply_on_socket:
+                        await websocket.send_json(rejection)
+                        await websocket.close()
+                    else:
+                        asyncio.create_task(send_result_to_client(CLIENT_URI, task_id, rejection=rejection))
+                    return
+
+                if reply_on_socket:
+                    await websocket.send_json(
+                        {"type": "status", "task_id": task_id, "status": "queued", "wait_estimate": round(wait_estimate)}
+                    )
+                    await stream_events_to_socket(websocket, task_id)
                     return
 
                 # Запускаем фоновую задачу для ожидания результата
-                client_uri = "ws://localhost:9000/client-endpoint"
-                asyncio.create_task(send_result_to_client(client_uri, task_id))
+                asyncio.create_task(send_result_to_client(CLIENT_URI, task_id))
                 return
 
-            audio_data += data
+            if not upload_id:
+                upload.write(data)
+            elif not await receive_frame(websocket, upload_id, upload, data):
+                return
 
     except WebSocketDisconnect as e:
         print(f"Клиент отключился. Код ошибки: {e.code}")
@@ -70,3 +318,11 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         print(f'Ошибка соединения : {e}')
         await websocket.close()
+
+    finally:
+        if upload_id and not received:
+            # Недокачанная загрузка ждёт переподключения клиента
+            pending_uploads.detach(upload_id, websocket)
+        elif upload is not None and not task_added:
+            # Если задача не попала в очередь, буфер больше никому не нужен
+            upload.close()
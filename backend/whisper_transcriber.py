@@ -1,39 +1,79 @@
+import time
+
+import numpy as np
 import torch
 
-from transformers import WhisperForConditionalGeneration, WhisperTokenizer, WhisperFeatureExtractor, pipeline
+from inference_backends import create_backend
 
 class WhisperTranscriber:
-    def __init__(self, model_name="openai/whisper-large-v3", language="russian"):
+    def __init__(self, model_name="openai/whisper-large-v3", language="russian", backend="hf"):
         """
         Инициализация модели Whisper для распознавания речи.
+        backend - движок инференса из inference_backends.BACKENDS
+        ("hf", "hf-int8" - квантованная модель для CPU, "ctranslate2").
         """
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model_name = model_name
+        self.language = language
+        self.backend = backend
 
         try:
-            self.model = WhisperForConditionalGeneration.from_pretrained(model_name).to(self.device)
-            self.tokenizer = WhisperTokenizer.from_pretrained(model_name, language=language, task="transcribe")
-            self.feature_extractor = WhisperFeatureExtractor.from_pretrained(model_name)
-
-            self.transcriber = pipeline(
-                "automatic-speech-recognition",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                feature_extractor=self.feature_extractor,
-                device=0 if self.device == "cuda" else -1,
-                batch_size=4
-            )
-            print("[INFO] WhisperTranscriber успешно инициализирован.")
+            self.transcriber = create_backend(backend, model_name, language, self.device)
+            print(f"[INFO] WhisperTranscriber успешно инициализирован ({model_name}, бэкенд {backend}).")
         except Exception as e:
             raise RuntimeError(f"Ошибка инициализации WhisperTranscriber: {e}")
 
+    def warm_up(self, batch_size=1, seconds=5, sr=16000):
+        """
+        Прогоняет через модель короткий шум, чтобы первая настоящая задача
+        не платила за выделение памяти и инициализацию ядер. Возвращает время прогрева (сек).
+        """
+        start = time.perf_counter()
+        audio = (np.random.default_rng(0).standard_normal(int(seconds * sr)) * 0.01).astype(np.float32)
+        self.transcribe_batch([audio] * batch_size)
+        return time.perf_counter() - start
+
     def transcribe_audio(self, audio):
         """
         Распознает текст из аудиозаписи (NumPy массив) с частотой дискретизации 16000 Гц.
         """
+        output, error = self.transcribe_with_timestamps(audio)
+        return (output["text"], None) if output else (None, error)
+
+    def transcribe_with_timestamps(self, audio):
+        """
+        Распознает запись и возвращает ({"text", "chunks"}, error).
+        chunks - фрагменты текста с метками времени (секунды от начала записи).
+        """
         try:
             result = self.transcriber(audio, return_timestamps=True)
-            return result["text"], None
+            return self.format_output(result), None
 
         except Exception as e:
             print(f"Ошибка транскрибации: {e}")
             return None, str(e)
+
+    @staticmethod
+    def format_output(result):
+        chunks = [
+            {"start": chunk["timestamp"][0], "end": chunk["timestamp"][1], "text": chunk["text"]}
+            for chunk in result.get("chunks", [])
+        ]
+        return {"text": result["text"], "chunks": chunks}
+
+    def transcribe_batch(self, audios):
+        """
+        Распознает несколько записей одним вызовом пайплайна.
+        Возвращает список ({"text", "chunks"}, error) в том же порядке, что и audios.
+        """
+        if len(audios) == 1:
+            return [self.transcribe_with_timestamps(audios[0])]
+
+        try:
+            results = self.transcriber(list(audios), return_timestamps=True, batch_size=len(audios))
+            return [(self.format_output(result), None) for result in results]
+
+        except Exception as e:
+            # Одна плохая запись не должна ронять весь батч: распознаём по одной
+            print(f"Ошибка батчевой транскрибации, повтор по одной записи: {e}")
+            return [self.transcribe_with_timestamps(audio) for audio in audios]
@@ -0,0 +1,101 @@
+"""
+Скорость и точность движков инференса Whisper на локальном наборе записей.
+Набор - каталог с парами name.wav + name.txt (эталонная расшифровка); записи в репозиторий не кладём.
+Для каждого бэкенда печатается RTF (время распознавания / длительность аудио) и WER.
+Бэкенд ctranslate2 требует пакет faster-whisper; по умолчанию используется маленькая модель.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_backends.py fixtures/ [--model openai/whisper-tiny] [--backends hf hf-int8 ctranslate2]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import librosa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from whisper_transcriber import WhisperTranscriber
+
+SR = 16000
+
+
+def load_fixtures(directory):
+    """Пары (имя, аудио, эталонный текст), отсортированные по имени."""
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".wav"):
+            continue
+        stem = name[:-len(".wav")]
+        with open(os.path.join(directory, f"{stem}.txt"), "r", encoding="utf-8") as f:
+            reference = f.read()
+        audio, _ = librosa.load(os.path.join(directory, name), sr=SR, mono=True)
+        fixtures.append((stem, audio, reference))
+    return fixtures
+
+
+def words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def word_errors(reference, hypothesis):
+    """Расстояние Левенштейна по словам: число замен, вставок и удалений."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def run(backend, model, language, fixtures):
+    try:
+        transcriber = WhisperTranscriber(model_name=model, language=language, backend=backend)
+    except RuntimeError as e:
+        print(f"{backend:>12}: пропущен ({e})")
+        return
+
+    # Первый вызов прогревает модель и не учитывается
+    transcriber.transcribe_audio(fixtures[0][1])
+
+    audio_seconds = 0.0
+    elapsed = 0.0
+    errors = 0
+    reference_words = 0
+    for name, audio, reference in fixtures:
+        start = time.perf_counter()
+        text, error = transcriber.transcribe_audio(audio)
+        elapsed += time.perf_counter() - start
+        if error:
+            print(f"{backend:>12}: ошибка на {name}: {error}")
+            return
+        audio_seconds += audio.size / SR
+        errors += word_errors(words(reference), words(text))
+        reference_words += len(words(reference))
+
+    print(f"{backend:>12}: RTF {elapsed / audio_seconds:.3f}, WER {errors / max(reference_words, 1):.1%}"
+          f" ({len(fixtures)} записей, {audio_seconds:.0f} с)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures")
+    parser.add_argument("--model", default="openai/whisper-tiny")
+    parser.add_argument("--language", default="russian")
+    parser.add_argument("--backends", nargs="+", default=["hf", "hf-int8", "ctranslate2"])
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        sys.exit(f"В {args.fixtures} нет записей .wav")
+
+    print(f"Модель {args.model}, записей: {len(fixtures)}")
+    for backend in args.backends:
+        run(backend, args.model, args.language, fixtures)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Подавление шума: прежний вызов nr.reduce_noise против spectral_gate (один поток, несколько
+потоков, готовый профиль шума источника без оценки по записи).
+
+Сходство выходов печатается как корреляция и отношение сигнала к разнице (дБ) относительно
+прежнего вызова и относительно nr.reduce_noise(stationary=True) - того же алгоритма
+стационарного гейта с профилем шума, что и spectral_gate. Прежний вызов без stationary=True
+работал в нестационарном режиме и образец шума y_noise не использовал.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_denoise.py [--seconds 10 60 600] [--workers 4] [файл.wav ...]
+"""
+import argparse
+import os
+import sys
+import time
+
+import librosa
+import noisereduce as nr
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from audio_preprocessing import AdvancedAudioProcessor
+from fixtures import SR, synthetic_audio
+from spectral_gate import NoiseProfile, spectral_gate
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def similarity(output, reference):
+    """Корреляция и отношение энергии reference к энергии разницы (дБ)."""
+    n = min(output.size, reference.size)
+    output, reference = output[:n].astype(np.float64), reference[:n].astype(np.float64)
+    difference = np.sum((output - reference) ** 2)
+    snr = 10 * np.log10(np.sum(reference ** 2) / difference) if difference > 0 else float("inf")
+    return np.corrcoef(output, reference)[0, 1], snr
+
+
+def compare(name, audio, workers):
+    print(f"\n{name}: {audio.size / SR:.0f} с")
+    noise_segment = AdvancedAudioProcessor.find_noise_segment(audio, SR)
+    if noise_segment is None:
+        print("  тихих участков нет, шум не подавляется")
+        return
+
+    previous, previous_t = timed(nr.reduce_noise, y=audio, sr=SR, y_noise=noise_segment, prop_decrease=0.8)
+    stationary, stationary_t = timed(
+        nr.reduce_noise, y=audio, sr=SR, y_noise=noise_segment, prop_decrease=0.8, stationary=True
+    )
+    new, new_t = timed(AdvancedAudioProcessor.remove_noise, audio, SR)
+    _, parallel_t = timed(AdvancedAudioProcessor.remove_noise, audio, SR, workers=workers)
+    noise_profile = NoiseProfile.from_noise(noise_segment, SR)
+    _, cached_t = timed(spectral_gate, audio, SR, noise_profile, prop_decrease=0.8)
+
+    for label, elapsed in (
+        ("nr.reduce_noise (прежний вызов)", previous_t),
+        ("nr.reduce_noise(stationary=True)", stationary_t),
+        ("remove_noise, 1 поток", new_t),
+        (f"remove_noise, потоков: {workers}", parallel_t),
+        ("spectral_gate с готовым профилем", cached_t),
+    ):
+        print(f"  {label:<34} {elapsed:8.3f} с  ускорение {previous_t / elapsed:5.1f}x")
+    for reference_name, reference in (("прежним вызовом", previous), ("stationary=True", stationary)):
+        correlation, snr = similarity(new, reference)
+        print(f"  сходство с {reference_name}: корреляция {correlation:.4f}, сигнал/разница {snr:5.1f} дБ")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help="записи для сравнения помимо синтетических")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[10, 60, 600])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    for seconds in args.seconds:
+        compare(f"synthetic {seconds:g}", synthetic_audio(seconds), args.workers)
+    for path in args.files:
+        audio, _ = librosa.load(path, sr=SR)
+        compare(path, audio, args.workers)
+
+
+if __name__ == "__main__":
+    main()
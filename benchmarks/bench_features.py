@@ -0,0 +1,54 @@
+"""
+Сравнение признаков для предобработки: отдельные проходы (глобальный RMS,
+покадровый RMS librosa для тихих участков и ZCR для каждого участка)
+против одного прохода AudioFeatures.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_features.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from audio_preprocessing import AdvancedAudioProcessor, AudioFeatures
+from fixtures import SR, synthetic_audio
+
+
+def separate_passes(audio):
+    np.sqrt(np.mean(audio**2))
+    quiet_segments = AdvancedAudioProcessor.find_quiet_segments(audio, SR)
+    return AdvancedAudioProcessor.find_noisiest_segment(audio, SR, quiet_segments)
+
+
+def shared_features(audio):
+    features = AudioFeatures(audio)
+    features.global_rms
+    return AdvancedAudioProcessor.find_noise_segment(audio, SR, features=features)
+
+
+def timed(func, audio, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(audio)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    # Прогрев librosa
+    separate_passes(synthetic_audio(5))
+    print(f"{'сек':>6} {'отдельные проходы, с':>22} {'AudioFeatures, с':>18}")
+    for seconds in (60, 600, 3600):
+        audio = synthetic_audio(seconds)
+        before, before_t = timed(separate_passes, audio)
+        after, after_t = timed(shared_features, audio)
+        print(f"{seconds:>6} {before_t:22.3f} {after_t:18.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Задержка живого распознавания: запись подаётся в LiveTranscriber в реальном времени
+фреймами по 100 мс, замеряется время до первого текста, до первого зафиксированного
+сегмента и среднее отставание фиксации от звука.
+Нужны transformers и torch; по умолчанию используется маленькая модель.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_live.py speech.wav [--model openai/whisper-tiny] [--step 2.0]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import librosa
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from inference_batcher import InferenceBatcher
+from live_transcriber import LiveTranscriber, SAMPLE_RATE
+from whisper_transcriber import WhisperTranscriber
+
+FRAME = SAMPLE_RATE // 10
+
+
+async def run(audio, transcriber, step):
+    batcher = InferenceBatcher(transcriber)
+    live = LiveTranscriber(batcher.transcribe, step_seconds=step)
+    start = time.perf_counter()
+
+    async def stream():
+        for offset in range(0, audio.size, FRAME):
+            live.feed(audio[offset:offset + FRAME])
+            await asyncio.sleep(max(0.0, (offset + FRAME) / SAMPLE_RATE - (time.perf_counter() - start)))
+        live.finish()
+
+    streaming = asyncio.create_task(stream())
+    first_text = first_segment = None
+    lags = []
+    async for event in live.iter_events("bench"):
+        now = time.perf_counter() - start
+        if event["type"] == "partial" and event["text"] and first_text is None:
+            first_text = now
+        elif event["type"] == "segment":
+            first_segment = first_segment if first_segment is not None else now
+            first_text = first_text if first_text is not None else now
+            lags.append(now - event["end"])
+    await streaming
+    batcher.batching_task.cancel()
+    return first_text, first_segment, lags
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("audio")
+    parser.add_argument("--model", default="openai/whisper-tiny")
+    parser.add_argument("--step", type=float, default=2.0)
+    args = parser.parse_args()
+
+    audio, _ = librosa.load(args.audio, sr=SAMPLE_RATE, mono=True)
+    transcriber = WhisperTranscriber(model_name=args.model)
+    transcriber.warm_up()
+
+    first_text, first_segment, lags = asyncio.run(run(audio.astype(np.float32), transcriber, args.step))
+    print(f"Запись {audio.size / SAMPLE_RATE:.0f} с, шаг {args.step} с")
+    if first_segment is None:
+        sys.exit("Модель не распознала в записи ни одного фрагмента")
+    print(f"Первый текст: {first_text:.2f} с, первый сегмент: {first_segment:.2f} с")
+    print(f"Отставание фиксации от звука: среднее {np.mean(lags):.2f} с, максимум {np.max(lags):.2f} с")
+
+
+if __name__ == "__main__":
+    main()
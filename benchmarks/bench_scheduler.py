@@ -0,0 +1,113 @@
+"""
+Симуляция нагрузки на очередь задач: FIFO (как было) против TaskScheduler.
+Один клиент присылает пачку длинных видео, остальные - короткие голосовые сообщения.
+Обработка имитируется паузой, пропорциональной длительности записи, время ускорено в --speedup раз.
+Печатаются p50/p99 времени ожидания в очереди и общей задержки по классам длины задач.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_scheduler.py [--workers 4] [--rtf 0.3] [--speedup 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from task_scheduler import TaskScheduler
+
+# Классы задач по длительности записи (сек)
+SIZE_CLASSES = [("короткие (<1 мин)", 0, 60), ("средние (1-10 мин)", 60, 600), ("длинные (>10 мин)", 600, float("inf"))]
+
+
+def workload(seed=0, light_clients=8, duration_minutes=60):
+    """
+    Список задач (время поступления, клиент, длительность записи) в секундах симуляции.
+    Тяжёлый клиент в начале присылает 20 видео по 20-60 мин, лёгкие клиенты равномерно
+    присылают голосовые по 5-50 с и изредка записи на несколько минут.
+    """
+    rng = np.random.default_rng(seed)
+    jobs = [(rng.uniform(0, 60), "heavy", rng.uniform(20, 60) * 60) for _ in range(20)]
+    for client in range(light_clients):
+        t = 0.0
+        while t < duration_minutes * 60:
+            t += rng.exponential(120)
+            length = rng.uniform(5, 50) if rng.random() < 0.9 else rng.uniform(120, 480)
+            jobs.append((t, f"light-{client}", length))
+    return sorted(jobs)
+
+
+class FifoQueue:
+    """Прежнее поведение: asyncio.Queue с тем же интерфейсом put, что у TaskScheduler."""
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    async def put(self, item, client_id="", priority="normal", cost=0.0):
+        await self.queue.put(item)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+async def simulate(queue, jobs, workers, rtf, speedup):
+    start = time.perf_counter()
+    records = []
+
+    def now():
+        return (time.perf_counter() - start) * speedup
+
+    async def worker():
+        while True:
+            arrival, length = await queue.get()
+            started = now()
+            await asyncio.sleep(length * rtf / speedup)
+            records.append((length, started - arrival, now() - arrival))
+
+    async def submit():
+        for arrival, client, length in jobs:
+            await asyncio.sleep(max(0.0, (arrival - now()) / speedup))
+            await queue.put((arrival, length), client_id=client, cost=length)
+
+    running = [asyncio.create_task(worker()) for _ in range(workers)]
+    await submit()
+    while len(records) < len(jobs):
+        await asyncio.sleep(0.01)
+    for task in running:
+        task.cancel()
+    return records
+
+
+def report(name, records):
+    print(name)
+    for label, low, high in SIZE_CLASSES:
+        selected = [(wait, latency) for length, wait, latency in records if low <= length < high]
+        if not selected:
+            continue
+        waits, latencies = np.array(selected).T
+        print(f"  {label:<20} n={len(selected):<4} ожидание p50 {np.percentile(waits, 50) / 60:7.1f} мин,"
+              f" p99 {np.percentile(waits, 99) / 60:7.1f} мин;"
+              f" задержка p50 {np.percentile(latencies, 50) / 60:7.1f} мин, p99 {np.percentile(latencies, 99) / 60:7.1f} мин")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rtf", type=float, default=0.3)
+    parser.add_argument("--speedup", type=float, default=2000)
+    args = parser.parse_args()
+
+    jobs = workload()
+    print(f"Задач: {len(jobs)}, обработчиков: {args.workers}, RTF {args.rtf}, ускорение x{args.speedup:g}")
+
+    async def run_both():
+        report("FIFO", await simulate(FifoQueue(), jobs, args.workers, args.rtf, args.speedup))
+        report("TaskScheduler", await simulate(TaskScheduler(maxsize=0), jobs, args.workers, args.rtf, args.speedup))
+
+    asyncio.run(run_both())
+
+
+if __name__ == "__main__":
+    main()
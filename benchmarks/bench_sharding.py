@@ -0,0 +1,53 @@
+"""
+Время распознавания длинной записи в зависимости от числа процессов-шардов.
+Нужны transformers и torch; по умолчанию используется маленькая модель.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_sharding.py [--model openai/whisper-tiny] [--minutes 20] [--workers 1 2 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from sharded_transcriber import ShardedTranscriber
+from speech_windows import whole_audio_window
+from fixtures import SR, synthetic_audio
+
+
+async def run(model, audio, workers, shard_seconds):
+    sharded = ShardedTranscriber(model, "russian", workers=workers, shard_seconds=shard_seconds, sr=SR)
+    try:
+        # Прогрев: загрузка модели во всех процессах
+        await sharded.transcribe([whole_audio_window(audio[:SR], SR)] * workers)
+        start = time.perf_counter()
+        _, _, error = await sharded.transcribe([whole_audio_window(audio, SR)])
+        if error:
+            raise RuntimeError(error)
+        return time.perf_counter() - start
+    finally:
+        sharded.pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="openai/whisper-tiny")
+    parser.add_argument("--minutes", type=float, default=20)
+    parser.add_argument("--shard-seconds", type=float, default=120)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    audio = synthetic_audio(args.minutes * 60)
+    print(f"Запись {audio.size / SR / 60:.1f} мин, шард {args.shard_seconds:.0f} с, модель {args.model}")
+    baseline = None
+    for workers in args.workers:
+        elapsed = asyncio.run(run(args.model, audio, workers, args.shard_seconds))
+        baseline = baseline or elapsed
+        print(f"  процессов: {workers:>2}  время: {elapsed:7.1f} с  ускорение: {baseline / elapsed:4.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Микробенчмарк и проверка эквивалентности векторизованных find_spikes,
+remove_spikes и find_quiet_segments с исходными реализациями на циклах.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_spikes.py [путь_к_аудио ...]
+"""
+import os
+import sys
+import time
+
+import librosa
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from audio_preprocessing import AdvancedAudioProcessor
+from fixtures import SR, synthetic_audio
+
+
+def reference_find_spikes(audio, threshold_multiplier=3):
+    abs_audio = np.abs(audio)
+    perc_90 = np.percentile(abs_audio, 90)
+    perc_99 = np.percentile(abs_audio, 99)
+    threshold = perc_90 + threshold_multiplier * perc_99
+    spike_indices = np.where(abs_audio > threshold)[0]
+    spikes = []
+    if len(spike_indices) > 0:
+        start = spike_indices[0]
+        for i in range(1, len(spike_indices)):
+            if spike_indices[i] > spike_indices[i - 1] + 1:
+                spikes.append((start, spike_indices[i - 1]))
+                start = spike_indices[i]
+        spikes.append((start, spike_indices[-1]))
+    return spikes
+
+
+def reference_remove_spikes(audio, spikes):
+    audio_copy = audio.copy()
+    for start, end in spikes:
+        pre_value = audio[start - 1] if start > 0 else 0
+        post_value = audio[end + 1] if end < len(audio) - 1 else 0
+        mean_value = (pre_value + post_value) / 2
+        audio_copy[start:end + 1] = mean_value
+    return audio_copy
+
+
+def reference_find_quiet_segments(audio, sr, frame_size=8192, hop_length=2048, min_duration=1.0, max_gap=3):
+    rms = librosa.feature.rms(y=audio, frame_length=frame_size, hop_length=hop_length).flatten()
+    rms_high = np.percentile(rms, 20)
+    quiet_indices = np.where(rms <= rms_high)[0]
+    quiet_segments = []
+    start = None
+    count = 0
+    min_quiet_frames = int((sr / hop_length) * min_duration)
+    for i in range(len(quiet_indices)):
+        if start is None:
+            start = quiet_indices[i] * hop_length
+            count = 1
+        elif quiet_indices[i] == quiet_indices[i - 1] + 1:
+            count += 1
+        else:
+            if (quiet_indices[i] - quiet_indices[i - 1]) <= max_gap:
+                count += 1
+            else:
+                if count >= min_quiet_frames:
+                    end = quiet_indices[i - 1] * hop_length
+                    quiet_segments.append((start, end))
+                start = quiet_indices[i] * hop_length
+                count = 1
+    if start is not None and count >= min_quiet_frames:
+        end = quiet_indices[-1] * hop_length
+        quiet_segments.append((start, end))
+    return quiet_segments
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def compare(name, audio):
+    print(f"\n{name}: {audio.size / SR:.0f} с")
+
+    ref_spikes, ref_t = timed(reference_find_spikes, audio)
+    new_spikes, new_t = timed(AdvancedAudioProcessor.find_spikes, audio)
+    assert [(int(a), int(b)) for a, b in ref_spikes] == new_spikes, "find_spikes: результаты различаются"
+    print(f"  find_spikes ({len(new_spikes)} серий): {ref_t:.3f} с -> {new_t:.3f} с")
+
+    ref_audio, ref_t = timed(reference_remove_spikes, audio, ref_spikes)
+    new_audio, new_t = timed(AdvancedAudioProcessor.remove_spikes, audio, new_spikes)
+    assert ref_audio.dtype == new_audio.dtype and np.array_equal(ref_audio, new_audio), \
+        "remove_spikes: результаты различаются"
+    print(f"  remove_spikes: {ref_t:.3f} с -> {new_t:.3f} с")
+
+    ref_quiet, ref_t = timed(reference_find_quiet_segments, audio, SR)
+    new_quiet, new_t = timed(AdvancedAudioProcessor.find_quiet_segments, audio, SR)
+    assert [(int(a), int(b)) for a, b in ref_quiet] == new_quiet, "find_quiet_segments: результаты различаются"
+    print(f"  find_quiet_segments ({len(new_quiet)} участков): {ref_t:.3f} с -> {new_t:.3f} с")
+
+
+def main():
+    for seconds in (10, 600, 3600):
+        compare(f"synthetic {seconds}", synthetic_audio(seconds))
+    for path in sys.argv[1:]:
+        audio, _ = librosa.load(path, sr=SR)
+        compare(path, audio)
+    print("\nРезультаты совпадают")
+
+
+if __name__ == "__main__":
+    main()
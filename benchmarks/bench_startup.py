@@ -0,0 +1,88 @@
+"""
+Время до готовности модели: загрузка с хаба и из локального снимка (safetensors, mmap),
+первый запрос без прогрева и после прогрева, а также самая долгая остановка цикла событий
+при загрузке в нём самом (как было раньше в startup_event) и в отдельном потоке.
+Нужны transformers и torch; по умолчанию используется маленькая модель.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py [--model openai/whisper-tiny] [--snapshot /tmp/whisper-snapshot]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from inference_backends import save_snapshot
+from whisper_transcriber import WhisperTranscriber
+
+SR = 16000
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+async def max_loop_stall(load):
+    """Самая долгая пауза тикера с шагом 10 мс, пока выполняется load()."""
+    stall = 0.0
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            stall = max(stall, now - last - 0.01)
+            last = now
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0.05)
+    await load()
+    ticking.cancel()
+    return stall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="openai/whisper-tiny")
+    parser.add_argument("--snapshot", default=None, help="каталог снимка (по умолчанию временный)")
+    args = parser.parse_args()
+
+    audio = (np.random.default_rng(1).standard_normal(10 * SR) * 0.05).astype(np.float32)
+
+    # Первая загрузка заодно скачивает модель в кэш HuggingFace, её время не сравниваем
+    WhisperTranscriber(model_name=args.model)
+
+    transcriber, hub_load = timed(WhisperTranscriber, model_name=args.model)
+    _, cold_request = timed(transcriber.transcribe_audio, audio)
+    print(f"Загрузка с хаба (из кэша): {hub_load:.2f} с, первый запрос без прогрева: {cold_request:.2f} с")
+
+    snapshot = args.snapshot or os.path.join(tempfile.mkdtemp(), "snapshot")
+    if not os.path.isdir(snapshot):
+        save_snapshot(args.model, snapshot)
+    transcriber, snapshot_load = timed(WhisperTranscriber, model_name=snapshot)
+    warmup = transcriber.warm_up()
+    _, warm_request = timed(transcriber.transcribe_audio, audio)
+    print(f"Загрузка из снимка: {snapshot_load:.2f} с, прогрев: {warmup:.2f} с, "
+          f"первый запрос после прогрева: {warm_request:.2f} с")
+
+    async def load_blocking():
+        WhisperTranscriber(model_name=snapshot)
+
+    async def load_in_thread():
+        await asyncio.to_thread(WhisperTranscriber, model_name=snapshot)
+
+    print(f"Остановка цикла событий при загрузке в нём: {asyncio.run(max_loop_stall(load_blocking)):.2f} с")
+    print(f"Остановка цикла событий при загрузке в потоке: {asyncio.run(max_loop_stall(load_in_thread)):.3f} с")
+
+
+if __name__ == "__main__":
+    main()
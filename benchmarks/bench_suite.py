@@ -0,0 +1,262 @@
+"""
+Сквозной бенчмарк обработки на синтетических записях от 10 секунд до 2 часов (см. fixtures.py).
+
+Замеряется декодирование, каждый шаг предобработки, полный AudioProcessor.process с поиском
+речи и пропускная способность TaskQueue, в которой Whisper заменён заглушкой. Каждый замер идёт
+в отдельном процессе, поэтому пик RSS относится только к нему. Результаты сравниваются
+с сохранённым базовым прогоном; замедление больше --tolerance считается регрессией
+(код возврата 1). Сеть, видеокарта, torch и transformers не нужны, нужен только ffmpeg.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_suite.py [--seconds 10 60 600 3600 7200] [--cases decode process queue]
+    python benchmarks/bench_suite.py --save-baseline    # записать текущий прогон как базовый
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+from fixtures import SR, FIXTURE_VERSION, fixture_path
+
+DEFAULT_SECONDS = [10, 60, 600, 3600, 7200]
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_FIXTURES_DIR = os.path.join(tempfile.gettempdir(), "transcriber-bench-fixtures")
+
+# Шаги AudioProcessor в порядке выполнения (ключи AudioProcessor.timings)
+STEPS = ["decode", "analysis", "spikes", "volume", "bandpass", "features", "denoise", "vad"]
+
+# Разница меньше этой (сек) не считается регрессией: короткие замеры слишком шумные
+MIN_REGRESSION_SECONDS = 0.1
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Пик RSS процесса в МБ (ru_maxrss в Linux - килобайты, в macOS - байты)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def load_upload(path):
+    """UploadBuffer с файлом, как после приёма по /ws (большие файлы уходят на диск)."""
+    from upload_buffer import UploadBuffer
+
+    upload = UploadBuffer()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            upload.write(chunk)
+    upload.finish()
+    return upload
+
+
+def bench_decode(path):
+    from audio_processor import AudioProcessor
+
+    with load_upload(path) as upload:
+        start = time.perf_counter()
+        audio, error = AudioProcessor(upload).decode_audio()
+        elapsed = time.perf_counter() - start
+    if audio is None:
+        raise RuntimeError(error)
+    return {"decode": elapsed}
+
+
+def bench_process(path):
+    """Полный цикл preprocess_upload: декодирование, шаги предобработки и окна речи."""
+    from audio_processor import preprocess_upload
+
+    with load_upload(path) as upload:
+        start = time.perf_counter()
+        windows, timings, _, error = preprocess_upload(upload, vad_window_seconds=30)
+        elapsed = time.perf_counter() - start
+    if windows is None:
+        raise RuntimeError(error)
+    return {"process": elapsed, **{step: timings[step] for step in STEPS if step in timings}}
+
+
+class StubTranscriber:
+    """Заглушка Whisper: «распознаёт» запись за stub_rtf её длительности."""
+    stub_rtf = 0.0
+
+    def __init__(self, model_name=None, language=None, backend=None):
+        self.model_name = model_name
+
+    def warm_up(self, batch_size=1):
+        return 0.0
+
+    def transcribe_batch(self, audios):
+        time.sleep(self.stub_rtf * sum(audio.size for audio in audios) / SR)
+        return [({"text": " фраза", "chunks": [{"start": 0.0, "end": audio.size / SR, "text": " фраза"}]}, None)
+                for audio in audios]
+
+
+def bench_queue(path, tasks, preprocess_workers, stub_rtf):
+    """Пропускная способность TaskQueue: tasks одинаковых задач, отправленных разом."""
+    # Whisper не загружается: модуль подменяется до импорта task_queue
+    StubTranscriber.stub_rtf = stub_rtf
+    sys.modules["whisper_transcriber"] = types.SimpleNamespace(WhisperTranscriber=StubTranscriber)
+    from task_queue import TaskQueue
+
+    async def run():
+        queue = TaskQueue(maxsize=tasks, preprocess_workers=preprocess_workers, cache_dir=None)
+        await queue.load_task
+        uploads = [load_upload(path) for _ in range(tasks)]
+        start = time.perf_counter()
+        for index, upload in enumerate(uploads):
+            _, error = await queue.add_task(upload, f"bench-{index}")
+            if error:
+                raise RuntimeError(error)
+        results = [await queue.wait_result(f"bench-{index}") for index in range(tasks)]
+        elapsed = time.perf_counter() - start
+        queue.preprocess_pool.shutdown()
+        for upload in uploads:
+            upload.close()
+        errors = [result["error"] for result in results if result.get("error")]
+        if errors:
+            raise RuntimeError(errors[0])
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    return {"queue": elapsed}
+
+
+def run_case(case, path, args):
+    """Выполняется в отдельном процессе: время шагов и пик RSS (для очереди - с процессами пула)."""
+    if case == "decode":
+        timings = bench_decode(path)
+    elif case == "process":
+        timings = bench_process(path)
+    else:
+        timings = bench_queue(path, args.queue_tasks, args.preprocess_workers, args.stub_rtf)
+    rss = peak_rss_mb()
+    if case == "queue":
+        rss = max(rss, peak_rss_mb(resource.RUSAGE_CHILDREN))
+    return timings, rss
+
+
+def measure(case, path, args):
+    """Лучшее время каждого шага за --repeat запусков и наибольший пик RSS."""
+    best, rss = {}, 0.0
+    context = multiprocessing.get_context("spawn")
+    for _ in range(args.repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            timings, peak = pool.submit(run_case, case, path, args).result()
+        for name, value in timings.items():
+            best[name] = min(best.get(name, float("inf")), value)
+        rss = max(rss, peak)
+    return best, rss
+
+
+def run_suite(args):
+    """Результаты в виде {"case/длина/шаг": {"seconds", "peak_rss_mb"}}; RSS - у строки всего замера."""
+    results = {}
+    cases = [case for case in args.cases if case != "queue"]
+    for seconds in args.seconds:
+        path = fixture_path(seconds, args.fixtures_dir)
+        for case in cases:
+            timings, rss = measure(case, path, args)
+            for name, value in timings.items():
+                row = {"seconds": value}
+                if name == case:
+                    row["peak_rss_mb"] = rss
+                    row["rtf"] = value / seconds
+                results[f"{case}/{seconds:g}s/{name}"] = row
+            print(f"  {case} {seconds:g} с: {timings[case]:.2f} с, пик RSS {rss:.0f} МБ", flush=True)
+
+    if "queue" in args.cases:
+        path = fixture_path(args.queue_seconds, args.fixtures_dir)
+        timings, rss = measure("queue", path, args)
+        elapsed = timings["queue"]
+        results[f"queue/{args.queue_tasks}x{args.queue_seconds:g}s/total"] = {
+            "seconds": elapsed,
+            "peak_rss_mb": rss,
+            "tasks_per_second": args.queue_tasks / elapsed,
+        }
+        print(f"  queue {args.queue_tasks} x {args.queue_seconds:g} с: {elapsed:.2f} с, "
+              f"{args.queue_tasks / elapsed:.2f} задач/с, пик RSS {rss:.0f} МБ", flush=True)
+    return results
+
+
+def change(value, base):
+    if base is None or not base:
+        return f"{'-':>8}"
+    return f"{(value - base) / base * 100:+7.1f}%"
+
+
+def report(results, baseline, tolerance):
+    """Печатает таблицу со сравнением с базовым прогоном, возвращает список регрессий."""
+    regressions = []
+    print(f"\n{'замер':<32} {'время, с':>10} {'база, с':>10} {'Δ':>8} {'RSS, МБ':>9} {'база':>8} {'Δ':>8}")
+    for key, row in results.items():
+        base = baseline.get(key, {})
+        base_time, base_rss = base.get("seconds"), base.get("peak_rss_mb")
+        rss = row.get("peak_rss_mb")
+        line = f"{key:<32} {row['seconds']:10.3f} "
+        line += f"{base_time:10.3f} " if base_time is not None else f"{'-':>10} "
+        line += change(row["seconds"], base_time)
+        if rss is not None:
+            line += f" {rss:9.0f} " + (f"{base_rss:8.0f} " if base_rss is not None else f"{'-':>8} ")
+            line += change(rss, base_rss)
+        print(line)
+
+        if base_time and row["seconds"] > base_time * (1 + tolerance) \
+                and row["seconds"] - base_time > MIN_REGRESSION_SECONDS:
+            regressions.append(f"{key}: время {base_time:.3f} -> {row['seconds']:.3f} с")
+        if rss is not None and base_rss and rss > base_rss * (1 + tolerance):
+            regressions.append(f"{key}: пик RSS {base_rss:.0f} -> {rss:.0f} МБ")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, nargs="+", default=DEFAULT_SECONDS, help="длины фикстур")
+    parser.add_argument("--cases", nargs="+", choices=["decode", "process", "queue"],
+                        default=["decode", "process", "queue"])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--queue-tasks", type=int, default=16)
+    parser.add_argument("--queue-seconds", type=float, default=60)
+    parser.add_argument("--preprocess-workers", type=int, default=2)
+    parser.add_argument("--stub-rtf", type=float, default=0.0, help="время заглушки / длительность записи")
+    parser.add_argument("--fixtures-dir", default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="допустимое замедление (доля)")
+    args = parser.parse_args()
+
+    print(f"Фикстуры v{FIXTURE_VERSION} в {args.fixtures_dir}")
+    results = run_suite(args)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "fixture_version": FIXTURE_VERSION,
+                "machine": f"{platform.machine()} {platform.processor() or platform.system()}, {os.cpu_count()} CPU",
+                "python": platform.python_version(),
+                "results": {key: {name: round(value, 4) for name, value in row.items()} for key, row in results.items()},
+            }, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nБазовый прогон сохранён в {args.baseline}")
+    elif regressions:
+        print("\nРегрессии:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
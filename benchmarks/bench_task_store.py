@@ -0,0 +1,94 @@
+"""
+Бенчмарк хранилища задач фронтенда: 10 000 задач, параллельные обновления
+из нескольких потоков. Проверяет, что ни одно обновление не потеряно и что
+время обновления не растёт с числом задач.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_task_store.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend"))
+
+from task_store import SQLiteTaskStore
+
+N_TASKS = 10_000
+N_THREADS = 8
+SAMPLE_UPDATES = 1000
+
+
+def fill(store, n):
+    task_ids = [str(uuid.uuid4()) for _ in range(n)]
+    for i, task_id in enumerate(task_ids):
+        store.add_task(task_id, original_name=f"file_{i}.mp3", status="В обработке...", timestamp=time.time())
+    return task_ids
+
+
+def time_updates(store, task_ids):
+    """Среднее время одного обновления на выборке задач, мс."""
+    sample = task_ids[:SAMPLE_UPDATES]
+    start = time.perf_counter()
+    for task_id in sample:
+        store.update_task(task_id, status="Распознавание...")
+    return (time.perf_counter() - start) / len(sample) * 1000
+
+
+def concurrent_updates(store, task_ids):
+    """
+    Половина потоков пишет статус, половина - путь к расшифровке тех же задач.
+    Потерянным считается обновление, которое перезаписал другой поток.
+    """
+    def set_status(ids):
+        for task_id in ids:
+            store.update_task(task_id, status="Готово!")
+
+    def set_transcript(ids):
+        for task_id in ids:
+            store.update_task(task_id, transcript_path=f"transcripts/{task_id}.txt")
+
+    threads = []
+    for i in range(N_THREADS):
+        ids = task_ids[i // 2::N_THREADS // 2]
+        target = set_status if i % 2 == 0 else set_transcript
+        threads.append(threading.Thread(target=target, args=(ids,)))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    lost = 0
+    for task_id in task_ids:
+        task = store.get_task(task_id)
+        if task["status"] != "Готово!" or task["transcript_path"] != f"transcripts/{task_id}.txt":
+            lost += 1
+    return elapsed, lost
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = SQLiteTaskStore(os.path.join(tmp_dir, "tasks.db"))
+
+        task_ids = fill(store, 1000)
+        small_ms = time_updates(store, task_ids)
+        task_ids += fill(store, N_TASKS - 1000)
+        large_ms = time_updates(store, task_ids)
+        print(f"Обновление задачи: {small_ms:.3f} мс при 1000 задачах, {large_ms:.3f} мс при {N_TASKS}")
+
+        elapsed, lost = concurrent_updates(store, task_ids)
+        print(f"{2 * N_TASKS} параллельных обновлений в {N_THREADS} потоках: {elapsed:.2f} с, потеряно: {lost}")
+
+        start = time.perf_counter()
+        page = store.list_tasks(limit=20, offset=5000)
+        print(f"Страница из {len(page)} задач: {(time.perf_counter() - start) * 1000:.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
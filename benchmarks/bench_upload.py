@@ -0,0 +1,51 @@
+"""
+Бенчмарк приёма загрузки: время записи пакетов по 1000 байт в UploadBuffer
+в сравнении со склейкой bytes (audio_data += data).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_upload.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from upload_buffer import UploadBuffer
+
+FRAME_SIZE = 1000
+SIZES_MB = [1, 4, 16, 64, 256, 1024]
+# Склейка bytes квадратична, поэтому меряем её только на небольших размерах
+CONCAT_MAX_MB = 16
+
+
+def bench_buffer(total_bytes, frame):
+    start = time.perf_counter()
+    with UploadBuffer() as upload:
+        for _ in range(total_bytes // FRAME_SIZE):
+            upload.write(frame)
+        upload.finish()
+    return time.perf_counter() - start
+
+
+def bench_concat(total_bytes, frame):
+    start = time.perf_counter()
+    audio_data = b""
+    for _ in range(total_bytes // FRAME_SIZE):
+        audio_data += frame
+    return time.perf_counter() - start
+
+
+def main():
+    frame = os.urandom(FRAME_SIZE)
+    print(f"{'MB':>6} {'UploadBuffer, с':>16} {'с/МБ':>8} {'bytes +=, с':>12}")
+    for size_mb in SIZES_MB:
+        total_bytes = size_mb * 1024 * 1024
+        buffer_time = bench_buffer(total_bytes, frame)
+        concat_time = bench_concat(total_bytes, frame) if size_mb <= CONCAT_MAX_MB else None
+        concat_str = f"{concat_time:12.3f}" if concat_time is not None else f"{'-':>12}"
+        print(f"{size_mb:>6} {buffer_time:16.3f} {buffer_time / size_mb:8.4f} {concat_str}")
+
+
+if __name__ == "__main__":
+    main()
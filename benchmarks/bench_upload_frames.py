@@ -0,0 +1,99 @@
+"""
+Пропускная способность загрузки через localhost в зависимости от размера фрейма.
+Клиент - upload_client фронтенда, сервер принимает фреймы тем же receive_frame, что и /ws
+бэкенда (без постановки задачи в очередь). В полёте всегда около --in-flight МБ,
+так что фреймы по 1 КБ показывают прежний режим «сообщение на килобайт».
+Нужны зависимости бэкенда (websocket_server импортирует модель при загрузке модуля).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_upload_frames.py [--megabytes 256] [--frames-kb 1 64 256 1024]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "frontend"))
+
+import websocket_server
+from upload_buffer import PendingUploads
+from upload_client import upload_file
+
+PORT = 8765
+
+app = FastAPI()
+
+
+@app.websocket("/ws")
+async def receive_upload(websocket: WebSocket):
+    """Приём загрузки по протоколу /ws без распознавания: после END буфер просто закрывается."""
+    await websocket.accept()
+    upload_id = (await websocket.receive_json())["upload_id"]
+    upload = websocket_server.pending_uploads.attach(upload_id, websocket)
+    await websocket.send_json({"type": "ack", "offset": upload.size})
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            if data == b"END":
+                websocket_server.pending_uploads.complete(upload_id, websocket)
+                upload.close()
+                await websocket.close()
+                return
+            if not await websocket_server.receive_frame(websocket, upload_id, upload, data):
+                return
+    except WebSocketDisconnect:
+        websocket_server.pending_uploads.detach(upload_id, websocket)
+
+
+async def run(path, size, frame_sizes, in_flight):
+    server = uvicorn.Server(uvicorn.Config(app, port=PORT, log_level="warning", ws_max_size=64 * 1024 * 1024))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    for frame_size in frame_sizes:
+        window = max(1, in_flight // frame_size)
+        with open(path, "rb") as f:
+            start = time.perf_counter()
+            await upload_file(
+                f"ws://localhost:{PORT}/ws", f, size, {"upload_id": str(uuid.uuid4())}, lambda response: None,
+                frame_size=frame_size, window=window,
+            )
+            elapsed = time.perf_counter() - start
+        frames = -(-size // frame_size)
+        print(f"фрейм {frame_size // 1024:>5} КБ: {size / elapsed / 2 ** 20:8.1f} МБ/с, "
+              f"{elapsed:6.2f} с, {frames} сообщений")
+
+    server.should_exit = True
+    await serving
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=int, default=256)
+    parser.add_argument("--frames-kb", type=int, nargs="+", default=[1, 64, 256, 1024])
+    parser.add_argument("--in-flight", type=int, default=4, help="МБ без подтверждения")
+    args = parser.parse_args()
+
+    websocket_server.pending_uploads = PendingUploads()
+    size = args.megabytes * 2 ** 20
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "upload.bin")
+        with open(path, "wb") as f:
+            for _ in range(args.megabytes):
+                f.write(os.urandom(2 ** 20))
+
+        print(f"Файл {args.megabytes} МБ")
+        asyncio.run(run(path, size, [kb * 1024 for kb in args.frames_kb], args.in_flight * 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Детерминированные синтетические записи для бенчмарков: речеподобные тональные фразы с паузами,
+фоновый шум, короткие пики и длинные участки тишины.
+Запись строится поминутно, у каждой минуты своё зерно: начало записи не зависит от её длины,
+а WAV на несколько часов пишется на диск без генерации всего сигнала в памяти.
+"""
+import os
+import wave
+
+import numpy as np
+
+SR = 16000
+BLOCK_SECONDS = 60
+
+# Меняется при любом изменении генератора, чтобы не использовать старые файлы из кэша
+FIXTURE_VERSION = 1
+
+
+def synthetic_block(seconds, seed=0, index=0):
+    """Один блок записи (float32, 16 кГц)."""
+    rng = np.random.default_rng([seed, index])
+    n = int(seconds * SR)
+    audio = (rng.standard_normal(n) * 0.003).astype(np.float32)
+
+    position = 0
+    while position < n:
+        # Иногда - длинная тишина с очень слабым шумом
+        if rng.random() < 0.05:
+            length = min(int(rng.uniform(5, 15) * SR), n - position)
+            audio[position:position + length] *= 0.03
+            position += length
+            continue
+
+        # Фраза: основной тон с плавным дрейфом, три гармоники и слоговая огибающая ~4 Гц
+        length = min(int(rng.uniform(3, 8) * SR), n - position)
+        t = np.arange(length) / SR
+        pitch = rng.uniform(100, 250) * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(0.2, 0.5) * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / SR
+        tone = np.sin(phase) + 0.5 * np.sin(2 * phase) + 0.25 * np.sin(3 * phase)
+        envelope = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t), 0, None)
+        audio[position:position + length] += (rng.uniform(0.05, 0.3) * tone * envelope).astype(np.float32)
+        position += length
+
+        # Пауза между фразами
+        position += int(rng.uniform(0.3, 2) * SR)
+
+    # Щелчки длиной 1-4 отсчёта, в среднем два в секунду
+    for start in rng.choice(max(n - 4, 1), size=min(int(seconds * 2), max(n - 4, 1)), replace=False):
+        audio[start:start + rng.integers(1, 5)] = rng.choice([-0.95, 0.95])
+    return audio
+
+
+def iter_blocks(seconds, seed=0):
+    """Запись длиной seconds блоками по BLOCK_SECONDS."""
+    index = 0
+    while seconds > 0:
+        # Последний блок генерируется целиком и обрезается, иначе он зависел бы от длины записи
+        yield synthetic_block(BLOCK_SECONDS, seed, index)[:int(min(seconds, BLOCK_SECONDS) * SR)]
+        seconds -= BLOCK_SECONDS
+        index += 1
+
+
+def synthetic_audio(seconds, seed=0):
+    """Запись длиной seconds целиком (float32, 16 кГц)."""
+    return np.concatenate(list(iter_blocks(seconds, seed)))
+
+
+def write_wav(path, seconds, seed=0):
+    """Пишет запись в WAV (16 бит, моно, 16 кГц) поблочно."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SR)
+        for block in iter_blocks(seconds, seed):
+            f.writeframes((np.clip(block, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def fixture_path(seconds, directory, seed=0):
+    """Путь к WAV-фикстуре; файл создаётся при первом обращении и дальше переиспользуется."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"synthetic_v{FIXTURE_VERSION}_seed{seed}_{seconds:g}s.wav")
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp"
+        write_wav(tmp_path, seconds, seed)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,47 @@
+import asyncio
+import io
+
+# Параметры кодирования для ffmpeg: моно 16 кГц - ровно то, что использует бэкенд
+AUDIO_FORMATS = {
+    "opus": ["-c:a", "libopus", "-b:a", "32k", "-f", "ogg"],
+    "flac": ["-c:a", "flac", "-f", "flac"],
+}
+
+# Размер порции, которой исходный файл подаётся в ffmpeg
+CHUNK_SIZE = 1024 * 1024
+
+
+async def extract_audio(source, audio_format="opus"):
+    """
+    Извлекает звуковую дорожку из файлового объекта source через локальный ffmpeg
+    и перекодирует её в моно 16 кГц (Opus или FLAC).
+    Возвращает (BytesIO со сжатым аудио, error).
+    """
+    args = ["ffmpeg", "-v", "error", "-i", "pipe:0", "-vn", "-ac", "1", "-ar", "16000",
+            *AUDIO_FORMATS[audio_format], "pipe:1"]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as e:
+        return None, f"Не удалось запустить ffmpeg: {e}"
+
+    async def feed_stdin():
+        try:
+            while chunk := await asyncio.to_thread(source.read, CHUNK_SIZE):
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg завершился раньше, причина будет в stderr
+            pass
+
+    feeding = asyncio.create_task(feed_stdin())
+    out, err = await asyncio.gather(process.stdout.read(), process.stderr.read())
+    await feeding
+    if await process.wait() != 0 or not out:
+        return None, err.decode(errors="replace").strip() or "ffmpeg не вернул аудио"
+    return io.BytesIO(out), None
@@ -0,0 +1,24 @@
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    def __init__(self):
+        """
+        Один долгоживущий цикл событий в фоновом потоке для всех загрузок процесса.
+        Поток запускается при первой задаче, а не при импорте модуля.
+        """
+        self.loop = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="background-loop", daemon=True).start()
+                self.loop = loop
+        return self.loop
+
+    def submit(self, coro):
+        """Запускает корутину в фоновом цикле и возвращает concurrent.futures.Future с её результатом."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop or self._start())
@@ -1,50 +1,78 @@
-import json
+import asyncio
 import os
 import time
 import uuid
 
+from audio_extract import extract_audio
+
 class FileManager:
     allowed_extensions = {".mp3", ".wav", ".flac", ".aac", ".ogg", ".m4a",
                           ".wma", ".mp4", ".mkv", ".avi", ".mov", ".wmv", ".webm"}
+    video_extensions = {".mp4", ".mkv", ".avi", ".mov", ".wmv", ".webm"}
 
-    def __init__(self, send_file_func):
-        """Инициализирует FileManager с функцией send_file"""
-        self.send_file = send_file_func
+    def __init__(self, send_upload_func, task_store, background_loop, max_concurrent_uploads=3,
+                 extract_audio_format=None):
+        """
+        Инициализирует FileManager с функцией send_upload, хранилищем задач
+        и фоновым циклом событий, в котором идут все загрузки.
+        Одновременно отправляется не больше max_concurrent_uploads файлов, остальные ждут.
+        Если задан extract_audio_format ("opus" или "flac"), из видео перед отправкой
+        локально извлекается звуковая дорожка в моно 16 кГц.
+        """
+        self.send_upload = send_upload_func
+        self.task_store = task_store
+        self.background_loop = background_loop
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.extract_audio_format = extract_audio_format
+        # Семафор создаётся в фоновом цикле при первой загрузке
+        self.upload_slots = None
 
-    def add_task(self, file_path):
-        """Добавляет задачу в файл tasks.json."""
-        if not self.is_valid_file(file_path):
-            print(f"Недопустимый файл: {file_path}")
+    def add_task(self, file_name):
+        """Добавляет задачу в хранилище задач. Возвращает task_id или None для неподдерживаемого файла."""
+        if not self.is_valid_file(file_name):
+            print(f"Недопустимый файл: {file_name}")
             return None
 
         task_id = str(uuid.uuid4())
+        self.task_store.add_task(
+            task_id,
+            original_name=os.path.basename(file_name),
+            status="В обработке...",
+            timestamp=time.time(),
+        )
+        return task_id
 
-        while True:
-            try:
-                if os.path.exists("tasks.json"):
-                    with open("tasks.json", "r+", encoding="utf-8") as f:
-                        tasks = json.load(f)
-                else:
-                    tasks = {}
-
-                # Добавляем новую задачу
-                tasks[task_id] = {
-                    "original_name": os.path.basename(file_path),
-                    "status": "В обработке...",
-                    "transcript_path": None,
-                    "error": None,
-                    "timestamp": time.time()
-                }
+    def start_upload(self, source, size, task_id, file_name="", client_id=""):
+        """
+        Отправляет source (файловый объект, size байт) на бэкенд в фоновом цикле, не дожидаясь конца.
+        Данные читаются из source фреймами, без копии на диск или в память.
+        client_id - идентификатор сессии пользователя: бэкенд делит очередь честно между клиентами.
+        """
+        return self.background_loop.submit(self.upload(source, size, task_id, file_name, client_id))
 
-                # Записываем изменения
-                with open("tasks.json", "w", encoding="utf-8") as f:
-                    json.dump(tasks, f, indent=4)
+    async def upload(self, source, size, task_id, file_name="", client_id=""):
+        """Ждёт свободный слот загрузки, при необходимости извлекает аудио и отправляет файл."""
+        if self.upload_slots is None:
+            self.upload_slots = asyncio.Semaphore(self.max_concurrent_uploads)
 
-                return task_id, file_path
+        async with self.upload_slots:
+            if self.extract_audio_format and self.is_video_file(file_name):
+                self.task_store.update_task(task_id, status="Извлечение аудио...")
+                audio, error = await extract_audio(source, self.extract_audio_format)
+                if audio is not None:
+                    source, size = audio, audio.getbuffer().nbytes
+                else:
+                    # Без локального ffmpeg или для нечитаемого из потока файла отправляем оригинал
+                    print(f"Не удалось извлечь аудио из {file_name}, отправляется исходный файл: {error}")
+                    source.seek(0)
+                self.task_store.update_task(task_id, status="В обработке...")
 
-            except (OSError):
-                time.sleep(0.1)
+            await self.send_upload(source, size, task_id, client_id)
 
     def is_valid_file(self, file_path):
         """Проверяет, поддерживается ли загруженный файл"""
         return os.path.splitext(file_path)[1].lower() in self.allowed_extensions
+
+    def is_video_file(self, file_path):
+        """Проверяет, является ли файл видео (для отправки из него нужна только звуковая дорожка)"""
+        return os.path.splitext(file_path)[1].lower() in self.video_extensions
@@ -1,16 +1,13 @@
 import asyncio
 import threading
 import os
-import json
 import uvicorn
 
-from websocket_client import app
+from websocket_client import app, task_store
 
 def clear_tasks():
-    """Очищает файл tasks.json при запуске."""
-    if os.path.exists("tasks.json"):
-        with open("tasks.json", "w", encoding="utf-8") as f:
-            json.dump({}, f)
+    """Очищает хранилище задач при запуске."""
+    task_store.clear()
 
 def clear_transcripts():
     """Удаляет все файлы в папке transcripts при запуске."""
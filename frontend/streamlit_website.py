@@ -1,54 +1,47 @@
-import asyncio
-import os
-import threading
-import json
-import time
+import math
+import uuid
 import streamlit as st
 
-from websocket_client import file_manager
+from websocket_client import file_manager, task_store
 
-def load_tasks():
-    '''Загружает задачи из файла'''
-    while True:
-        try:
-            if os.path.exists("tasks.json"):
-                with open("tasks.json", "r", encoding="utf-8") as f:
-                    return json.load(f)
-            return {}
-        except (json.JSONDecodeError, OSError):
-            time.sleep(0.1)
+# Число задач на странице таблицы
+PAGE_SIZE = 20
 
-# Инициализируем переменную
-if "uploaded_file" not in st.session_state:
-    st.session_state["uploaded_file"] = None
+# Инициализируем переменную: файлы, уже отправленные в этой сессии
+if "uploaded_files" not in st.session_state:
+    st.session_state["uploaded_files"] = set()
+
+# Идентификатор сессии: бэкенд делит очередь между клиентами, а все сессии Streamlit
+# подключаются к нему с одного адреса
+if "client_id" not in st.session_state:
+    st.session_state["client_id"] = str(uuid.uuid4())
 
 # Заголовок
 st.title("Онлайн транскрипция аудио и видео")
 
-# Форма для загрузки одного файла
-uploaded_file = st.file_uploader(
-    "Загрузите файл для обработки",
-    accept_multiple_files=False
+# Форма для загрузки файлов
+uploaded_files = st.file_uploader(
+    "Загрузите файлы для обработки",
+    accept_multiple_files=True
 )
 
-# Обработка загруженного файла
-if uploaded_file and uploaded_file.name != st.session_state["uploaded_file"]:
-    file_path = os.path.join('uploaded_files', uploaded_file.name)
-
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.read())
+# Обработка загруженных файлов
+for uploaded_file in uploaded_files or []:
+    file_key = (uploaded_file.name, uploaded_file.size)
+    if file_key in st.session_state["uploaded_files"]:
+        continue
 
     # Добавляем задачу
-    task = file_manager.add_task(file_path)
-    if task:
-        task_id, file_path = task
-
-        # Отправляем файл на бэкэнд
-        threading.Thread(target=lambda: asyncio.run(file_manager.send_file(file_path, task_id))).start()
-        st.session_state["uploaded_file"] = uploaded_file.name
+    task_id = file_manager.add_task(uploaded_file.name)
+    if task_id:
+        # Буфер загрузки Streamlit отправляется на бэкенд напрямую, в общем фоновом цикле;
+        # одновременно идёт не больше MAX_CONCURRENT_UPLOADS загрузок, остальные ждут
+        file_manager.start_upload(
+            uploaded_file, uploaded_file.size, task_id, uploaded_file.name, st.session_state["client_id"]
+        )
     else:
         st.error(f"Формат файла {uploaded_file.name} не поддерживается.")
-        os.remove(file_path)
+    st.session_state["uploaded_files"].add(file_key)
 
 
 # Кнопка для обновления результатов
@@ -58,13 +51,13 @@ if st.button("Обновить результаты"):
 # Отображение таблицы с файлами и статусами
 st.subheader("Статус обработки файлов")
 
-# Загружаем задачи
-tasks = load_tasks()
-
 # Проверяем, есть ли задачи
-if tasks:
-    # Сортируем задачи по времени (новые сверху)
-    sorted_tasks = sorted(tasks.values(), key=lambda x: x["timestamp"], reverse=True)
+total_tasks = task_store.count_tasks()
+if total_tasks:
+    # Загружаем только текущую страницу (новые сверху)
+    pages = math.ceil(total_tasks / PAGE_SIZE)
+    page = st.number_input("Страница", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+    sorted_tasks = task_store.list_tasks(limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
 
     # Заголовки таблицы
     table_data = [["Имя файла", "Статус", "Результат"]]
@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+# Поля задачи в том порядке, в котором они хранятся
+TASK_FIELDS = ("task_id", "original_name", "status", "transcript_path", "error", "timestamp")
+
+
+class TaskStore(ABC):
+    """
+    Хранилище задач фронтенда. Задача - словарь с полями TASK_FIELDS.
+    """
+    @abstractmethod
+    def add_task(self, task_id, original_name, status, timestamp):
+        """Добавляет задачу."""
+
+    @abstractmethod
+    def get_task(self, task_id):
+        """Возвращает задачу или None, если её нет."""
+
+    @abstractmethod
+    def update_task(self, task_id, **fields):
+        """Меняет указанные поля задачи."""
+
+    @abstractmethod
+    def list_tasks(self, limit=50, offset=0):
+        """Страница задач, новые сверху."""
+
+    @abstractmethod
+    def count_tasks(self):
+        """Число задач."""
+
+    @abstractmethod
+    def clear(self):
+        """Удаляет все задачи."""
+
+
+class SQLiteTaskStore(TaskStore):
+    def __init__(self, path="tasks.db", timeout=30):
+        """
+        Хранилище задач в SQLite (режим WAL). Каждый поток работает со своим соединением,
+        обновление задачи - одна атомарная запись в строку по первичному ключу.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    original_name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    transcript_path TEXT,
+                    error TEXT,
+                    timestamp REAL NOT NULL
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS tasks_timestamp ON tasks (timestamp)")
+
+    def _connection(self):
+        """Соединение текущего потока (sqlite3 не разрешает делить его между потоками)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add_task(self, task_id, original_name, status, timestamp):
+        """Добавляет новую задачу."""
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO tasks (task_id, original_name, status, timestamp) VALUES (?, ?, ?, ?)",
+                (task_id, original_name, status, timestamp),
+            )
+
+    def get_task(self, task_id):
+        """Возвращает задачу по task_id или None."""
+        row = self._connection().execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def update_task(self, task_id, **fields):
+        """
+        Обновляет переданные поля задачи. Возвращает False, если задачи нет.
+        """
+        unknown = set(fields) - set(TASK_FIELDS[1:])
+        if unknown:
+            raise ValueError(f"Неизвестные поля задачи: {', '.join(sorted(unknown))}")
+        if not fields:
+            return self.get_task(task_id) is not None
+
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connection() as connection:
+            cursor = connection.execute(
+                f"UPDATE tasks SET {assignments} WHERE task_id = ?",
+                (*fields.values(), task_id),
+            )
+        return cursor.rowcount > 0
+
+    def list_tasks(self, limit=50, offset=0):
+        """Задачи от новых к старым, постранично."""
+        rows = self._connection().execute(
+            "SELECT * FROM tasks ORDER BY timestamp DESC LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_tasks(self):
+        return self._connection().execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def clear(self):
+        """Удаляет все задачи."""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM tasks")
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import struct
+
+import websockets
+
+# Заголовок фрейма: смещение данных в файле (uint64, big-endian), служит и порядковым номером фрейма
+FRAME_HEADER = struct.Struct(">Q")
+
+# Размер данных во фрейме и сколько фреймов можно отправить, не дожидаясь подтверждения
+DEFAULT_FRAME_SIZE = 512 * 1024
+DEFAULT_WINDOW = 8
+
+# Попытки переподключения при обрыве и максимальная пауза между ними (сек)
+DEFAULT_RETRIES = 5
+MAX_BACKOFF = 30
+
+
+class UploadInterrupted(Exception):
+    """Соединение оборвалось после отправки файла, повторная отправка создала бы дубликат задачи."""
+
+
+async def upload_file(uri, source, size, first_message, on_message, frame_size=DEFAULT_FRAME_SIZE,
+                      window=DEFAULT_WINDOW, retries=DEFAULT_RETRIES):
+    """
+    Отправляет source (файловый объект с seek/read, size байт) с докачкой после обрыва.
+    first_message должен содержать upload_id: по нему сервер находит прерванную загрузку
+    и сообщает подтверждённое смещение, с которого передача продолжается.
+    Сообщения сервера, кроме подтверждений, передаются в on_message до закрытия соединения.
+    """
+    for attempt in range(retries + 1):
+        progress = {"finished": False}
+        try:
+            await upload_attempt(uri, source, size, first_message, on_message, frame_size, window, progress)
+            return
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+            if progress["finished"]:
+                raise UploadInterrupted(str(e))
+            if attempt == retries:
+                raise
+            delay = min(2 ** attempt, MAX_BACKOFF)
+            print(f"Соединение прервано ({e}), повтор через {delay} с")
+            await asyncio.sleep(delay)
+
+
+async def upload_attempt(uri, source, size, first_message, on_message, frame_size, window, progress):
+    """Одна попытка: продолжает загрузку с подтверждённого сервером смещения."""
+    # Аудио и видео уже сжаты, permessage-deflate только тратит процессор
+    async with websockets.connect(uri, compression=None) as websocket:
+        await websocket.send(json.dumps(first_message))
+        acked = json.loads(await websocket.recv())["offset"]
+        acked_changed = asyncio.Event()
+
+        async def receive_messages():
+            nonlocal acked
+            try:
+                async for message in websocket:
+                    response = json.loads(message)
+                    if response.get("type") == "ack":
+                        acked = response["offset"]
+                        acked_changed.set()
+                    elif response.get("type") == "error":
+                        raise websockets.exceptions.WebSocketException(response["error"])
+                    else:
+                        on_message(response)
+            finally:
+                acked_changed.set()
+
+        receiver = asyncio.create_task(receive_messages())
+        try:
+            offset = acked
+            await asyncio.to_thread(source.seek, offset)
+            while offset < size:
+                # Не уходим дальше window фреймов от последнего подтверждения
+                while offset - acked >= window * frame_size and not receiver.done():
+                    acked_changed.clear()
+                    await acked_changed.wait()
+                if receiver.done():
+                    receiver.result()
+                    raise websockets.exceptions.WebSocketException("Сервер закрыл соединение до конца загрузки")
+
+                # Чтение файла не блокирует цикл событий
+                chunk = await asyncio.to_thread(source.read, frame_size)
+                if not chunk:
+                    break
+                await websocket.send(FRAME_HEADER.pack(offset) + chunk)
+                offset += len(chunk)
+
+            await websocket.send(b"END")
+            progress["finished"] = True
+            await receiver
+        finally:
+            receiver.cancel()
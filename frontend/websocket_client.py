@@ -1,35 +1,77 @@
-import time
 import os
-import json
-import websockets
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from background_loop import BackgroundLoop
 from file_manager import FileManager
+from task_store import SQLiteTaskStore
+from upload_client import upload_file, UploadInterrupted
 
 app = FastAPI()
 
-async def send_file(file_path, task_id):
-    """Отправляет файл на сервер через WebSocket."""
-    uri = "ws://localhost:8000/ws"
+# Хранилище задач
+TASKS_DB = "tasks.db"
+task_store = SQLiteTaskStore(TASKS_DB)
 
-    async with websockets.connect(uri) as websocket:
-        # Передаем task_id
-        await websocket.send(json.dumps({"task_id": task_id}))
+# Получать статусы и результат в соединении загрузки, а не через клиентский сервер.
+# Если соединение оборвётся после отправки файла, бэкенд доставит результат через клиентский сервер
+REPLY_ON_SOCKET = False
 
-        # Отправляем файл пакетами по 1000 фреймов
-        with open(file_path, "rb") as f:
-            while chunk := f.read(1000):
-                await websocket.send(chunk)
+# Размер данных в одном фрейме загрузки и число фреймов без подтверждения
+UPLOAD_FRAME_SIZE = 512 * 1024
+UPLOAD_WINDOW = 8
 
-        # Сообщаем об окончании пакетов
-        await websocket.send(b"END")
+# Сколько файлов отправлять одновременно
+MAX_CONCURRENT_UPLOADS = 3
 
-        # Ждем, пока сервер разорвет соединение
-        try:
-            while True:
-                await websocket.recv()
-        except websockets.exceptions.ConnectionClosed:
-            print(f"Сервер закрыл соединение после обработки {file_path}")
+# Формат, в который перед отправкой перекодируется звук из видео ("opus", "flac");
+# None - отправлять файл как есть. Нужен ffmpeg на узле фронтенда
+EXTRACT_AUDIO_FORMAT = None
+
+# Отображаемые статусы для событий бэкенда
+STATUS_LABELS = {
+    "queued": "В очереди...",
+    "preprocessing": "В обработке...",
+    "transcribing": "Распознавание...",
+}
+
+async def send_upload(source, size, task_id, client_id=""):
+    """
+    Отправляет файловый объект source (size байт) на сервер через WebSocket. Данные передаются
+    фреймами по UPLOAD_FRAME_SIZE, после обрыва соединения загрузка продолжается
+    с последнего подтверждённого смещения. client_id - сессия пользователя для честной очереди.
+    """
+    uri = "ws://localhost:8000/ws"
+
+    # Передаем task_id, идентификатор загрузки для докачки и способ получения результата
+    first_message = {"task_id": task_id, "upload_id": task_id}
+    if client_id:
+        first_message["client_id"] = client_id
+    if REPLY_ON_SOCKET:
+        first_message["reply"] = "socket"
+
+    try:
+        await upload_file(
+            uri,
+            source,
+            size,
+            first_message,
+            lambda response: handle_response(task_id, response),
+            frame_size=UPLOAD_FRAME_SIZE,
+            window=UPLOAD_WINDOW,
+        )
+        print(f"Сервер закрыл соединение после обработки задачи {task_id}")
+    except UploadInterrupted as e:
+        # Файл отправлен и обрабатывается, результат придёт на /client-endpoint
+        print(f"Соединение задачи {task_id} прервано после отправки файла: {e}")
+        set_task_status(task_id, "Ожидание результата...")
+    except Exception as e:
+        print(f"Ошибка отправки задачи {task_id}: {e}")
+        update_task({"task_id": task_id, "error": f"Не удалось отправить файл: {e}"})
+
+async def send_file(file_path, task_id, client_id=""):
+    """Отправляет файл с диска на сервер и удаляет его после обработки."""
+    with open(file_path, "rb") as f:
+        await send_upload(f, os.path.getsize(file_path), task_id, client_id)
 
     # Удаляем файл с сервера
     if os.path.exists(file_path):
@@ -38,8 +80,24 @@ async def send_file(file_path, task_id):
         except PermissionError:
             print(f"Не удалось удалить файл {file_path}")
 
+def handle_response(task_id, response):
+    """Обрабатывает статус или результат задачи, пришедший в соединение загрузки."""
+    if response.get("type") == "status":
+        status = STATUS_LABELS.get(response.get("status"), "В обработке...")
+        if response.get("wait_estimate"):
+            status = f"{status} (около {max(1, round(response['wait_estimate'] / 60))} мин)"
+        set_task_status(task_id, status)
+    elif response.get("type") == "result":
+        update_task(response)
+
 # Создаем объект класса FileManager
-file_manager = FileManager(send_file)
+file_manager = FileManager(
+    send_upload,
+    task_store,
+    BackgroundLoop(),
+    max_concurrent_uploads=MAX_CONCURRENT_UPLOADS,
+    extract_audio_format=EXTRACT_AUDIO_FORMAT,
+)
 
 @app.websocket("/client-endpoint")
 async def client_endpoint(websocket: WebSocket):
@@ -51,8 +109,9 @@ async def client_endpoint(websocket: WebSocket):
         while True:
             response = await websocket.receive_json()
 
-            # Обновляем задачи
+            # Обновляем задачи и подтверждаем доставку: без подтверждения бэкенд отправит результат снова
             update_task(response)
+            await websocket.send_json({"type": "ack", "task_id": response.get("task_id")})
 
     except WebSocketDisconnect:
         print("Соединение с WebSocket закрыто клиентом или сервером.")
@@ -61,50 +120,46 @@ async def client_endpoint(websocket: WebSocket):
         print(f"Ошибка на клиентском сервере: {e}")
 
 
+def set_task_status(task_id, status):
+    """Обновляет статус задачи."""
+    task_store.update_task(task_id, status=status)
+
+
 def update_task(response):
-    """Обновляет задачи в tasks.json при получении ответа от сервера."""
+    """Обновляет задачу при получении ответа от сервера."""
     # Получаем task_id
     task_id = response.get("task_id")
     if not task_id:
         print("Ошибка: отсутствует task_id в ответе сервера.")
         return
 
-    while True:
-        try:
-            with open("tasks.json", "r+", encoding="utf-8") as f:
-                tasks = json.load(f)
-                if task_id not in tasks:
-                    print(f"Неизвестный task_id: {task_id}")
-                    return
-
-                # Проверяем наличие ошибок при обработке
-                if response.get("error"):
-                    tasks[task_id]["status"] = f"Ошибка: {response['error']}"
-                    tasks[task_id]["error"] = response["error"]
-
-                # Получаем расшифровку
-                elif response.get("transcript"):
-                    # Проверяем есть ли нужная папка
-                    os.makedirs("transcripts", exist_ok=True)
-
-                    # Формируем новое имя для файла
-                    txt_file = os.path.join("transcripts", f"{tasks[task_id]['original_name'].rsplit('.', 1)[0]}.txt")
-                    counter = 1
-                    while os.path.exists(txt_file):
-                        txt_file = os.path.join("transcripts", f"{tasks[task_id]['original_name'].rsplit('.', 1)[0]} ({counter}).txt")
-                        counter += 1
-                    with open(txt_file, "w", encoding="utf-8") as t:
-                        t.write(response["transcript"])
-
-                    # Меняем статус
-                    tasks[task_id]["status"] = "Готово!"
-                    tasks[task_id]["transcript_path"] = txt_file
-
-            # Обновляем нужную задачу
-            with open("tasks.json", "w", encoding="utf-8") as f:
-                json.dump(tasks, f, indent=4)
-
-            break
-
-        except (OSError, json.JSONDecodeError):
-            time.sleep(0.1)
+    task = task_store.get_task(task_id)
+    if task is None:
+        print(f"Неизвестный task_id: {task_id}")
+        return
+
+    # Повторная доставка уже сохранённого результата
+    if task["transcript_path"]:
+        return
+
+    # Проверяем наличие ошибок при обработке
+    if response.get("error"):
+        task_store.update_task(task_id, status=f"Ошибка: {response['error']}", error=response["error"])
+
+    # Получаем расшифровку; пустая строка - в записи не нашлось речи
+    elif response.get("transcript") is not None:
+        # Проверяем есть ли нужная папка
+        os.makedirs("transcripts", exist_ok=True)
+
+        # Формируем новое имя для файла
+        base_name = task['original_name'].rsplit('.', 1)[0]
+        txt_file = os.path.join("transcripts", f"{base_name}.txt")
+        counter = 1
+        while os.path.exists(txt_file):
+            txt_file = os.path.join("transcripts", f"{base_name} ({counter}).txt")
+            counter += 1
+        with open(txt_file, "w", encoding="utf-8") as t:
+            t.write(response["transcript"])
+
+        # Меняем статус
+        task_store.update_task(task_id, status="Готово!", transcript_path=txt_file)